@@ -1,51 +1,53 @@
-import matplotlib
-matplotlib.use('Agg')
+import concurrent.futures
 from flask import Flask, request, render_template_string
-from qiskit import transpile
-from qiskit_aer import AerSimulator
 import numpy as np
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
-from website.preprocess import load_and_process_image
-from website.build_circuit import build_circuit
+from website.preprocess import dataset_size, get_image
+from website.result_cache import ResultCache
 from website.analysis import balanced_weighted_mae, SSIM, mae, quantum_state_fidelity
+from website.png import png_data_uri, render_png
+from website.reconstruction import DEFAULT_SEED, MAX_SHOTS, reconstruct
+from website.simulate import get_simulator
+from website.routes.images import images_bp, reconstruction_url
 
 app = Flask(__name__)
-simulator = AerSimulator()
+app.register_blueprint(images_bp)
+result_cache = ResultCache()
+# /img/recon re-renders reconstructions through the same cache
+app.result_cache = result_cache
 
-def array_to_base64_img(arr, size=None):
-    fig, ax = plt.subplots(figsize=(size, size) if size else None)
-    ax.imshow(arr, cmap='gray', vmin=0, vmax=255)
-    ax.axis('off')
-    plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-    buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0)
-    plt.close(fig)
-    buf.seek(0)
-    return base64.b64encode(buf.read()).decode('utf-8')
+IMAGES_PER_PAGE = 20
+# Thumbnails are rendered by /img/<index>.png on demand and kept in the PNG LRU; after
+# serving a page, the neighbouring pages are rendered in the background.
+_prefetcher = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+def _render_page_thumbnails(page):
+    start = page * IMAGES_PER_PAGE
+    for i in range(start, min(start + IMAGES_PER_PAGE, dataset_size())):
+        render_png(get_image(i))
+
+def prefetch_neighbouring_pages(page, num_pages):
+    for p in (page + 1, page - 1):
+        if 0 <= p < num_pages:
+            _prefetcher.submit(_render_page_thumbnails, p)
+
+def page_selector_html(page, num_pages, window=3):
+    # first and last page, a window around the current one, and a box to jump anywhere
+    shown = sorted({0, num_pages - 1, *range(max(page - window, 0), min(page + window + 1, num_pages))})
+    buttons = []
+    for k, p in enumerate(shown):
+        if k and p != shown[k - 1] + 1:
+            buttons.append('<span class="page-gap">…</span>')
+        active = 'active' if p == page else ''
+        buttons.append(f'<button type="button" class="page-btn {active}" style="margin: 0 10px 10px 0; padding: 10px 22px; font-size: 1.15em;" onclick="gotoPage({p})">{p+1}</button>')
+    jump = (f'<input type="number" min="1" max="{num_pages}" placeholder="Page" style="width: 90px;" '
+            f'onchange="gotoPage(Math.min(Math.max(this.value, 1), {num_pages}) - 1)">')
+    return ('<div class="page-selector-flex"><div class="page-selector" style="gap: 16px; display: flex; justify-content: center; flex-wrap: wrap; align-items: center;">'
+            + ''.join(buttons) + jump + '</div></div>')
 
 @app.route('/', methods=['GET', 'POST'])
 def demo():
-    global THUMB_CACHE, IMAGES_CACHE
-    if 'THUMB_CACHE' not in globals():
-        THUMB_CACHE = None
-    if 'IMAGES_CACHE' not in globals():
-        IMAGES_CACHE = None
-    if THUMB_CACHE is None or IMAGES_CACHE is None:
-        print("Loading images and generating thumbnails (first time)...")
-        images, _ = load_and_process_image(0)
-        print(f"Total images loaded: {len(images)}")
-        images = images[:100]
-        IMAGES_CACHE = images
-        image_thumbs = [array_to_base64_img(img) for img in images]
-        THUMB_CACHE = image_thumbs
-        print("All thumbnails generated and cached.")
-    else:
-        images = IMAGES_CACHE
-        image_thumbs = THUMB_CACHE
-    num_images = len(images)
-    images_per_page = 20
+    num_images = dataset_size()
+    images_per_page = IMAGES_PER_PAGE
     num_pages = (num_images + images_per_page - 1) // images_per_page
 
     print(f"Request method: {request.method}")
@@ -58,71 +60,29 @@ def demo():
             index = int(request.form['index'])
             page = int(request.form.get('page', 0))
             print(f"POST index: {index}, shots: {shots}, page: {page}")
-            original_image = images[index]
-            # Convert image to angles (1D array)
-            pixel_values = original_image.flatten()
-            normalized_pixels = pixel_values / 255.0
-            angles = np.arcsin(normalized_pixels)
-            qc = build_circuit(angles)
-            print(f"qc type: {type(qc)}")
-            t_qc = transpile(qc, simulator)
-            result = simulator.run(t_qc, shots=shots).result()
-            counts = result.get_counts()
-            print(f"Counts: {counts}")
-            retrieved = np.zeros((64,), dtype=float)
-            for idx2 in range(64):
-                key = '1' + format(idx2, '06b')
-                freq = counts.get(key, 0)
-                retrieved[idx2] = np.sqrt(freq / shots) if freq else 0.0
-            print(f"Retrieved array: {retrieved}")
-            if isinstance(retrieved, np.ndarray) and retrieved.shape == (64,):
-                retrieved_img = np.clip(retrieved * 8.0 * 255.0, 0, 255).astype(np.uint8).reshape((8, 8))
-            else:
-                print(f"Warning: retrieved is not shape (64,): {retrieved}")
-                retrieved_img = np.zeros((8,8), dtype=np.uint8)
-            original_b64 = array_to_base64_img(original_image)
-            retrieved_b64 = array_to_base64_img(retrieved_img)
-            # Compute difference image
-            try:
-                diff_img = np.abs(original_image.astype(float) - retrieved_img.astype(float))
-                diff_b64 = array_to_base64_img(diff_img, size=1.5)
-            except Exception as e:
-                print(f"Diff error: {e}")
-                diff_b64 = None
-            # Compute fidelities
-            try:
-                balanced_mae_fid = balanced_weighted_mae(original_image, retrieved_img)
-            except Exception as e:
-                print(f"Balanced MAE error: {e}")
-                balanced_mae_fid = 'N/A'
-            try:
-                ssim_fid = SSIM(original_image, retrieved_img)
-            except Exception as e:
-                print(f"SSIM error: {e}")
-                ssim_fid = 'N/A'
-            try:
-                mae_fid = mae(original_image, retrieved_img)
-            except Exception as e:
-                print(f"MAE error: {e}")
-                mae_fid = 'N/A'
-            try:
-                state_fid = quantum_state_fidelity(original_image, retrieved_img)
-            except Exception as e:
-                print(f"Quantum State Fidelity error: {e}")
-                state_fid = 'N/A'
+            page = min(max(page, 0), num_pages - 1)
+            if not 1 <= shots <= MAX_SHOTS:
+                return f"<p>Error: shots must be within 1-{MAX_SHOTS}</p>", 400
+            seed = request.form.get('seed', DEFAULT_SEED, type=int)
+            # memoized per (index, shots, seed), shared with /inspect_image and /img/recon
+            recon = reconstruct(index, shots, get_simulator(), seed, 'all', result_cache)
+            original_src = f'/img/{index}.png'
+            retrieved_src = reconstruction_url(index, shots, seed, 'retrieved')
+            diff_src = reconstruction_url(index, shots, seed, 'diff')
+            balanced_mae_fid = recon['metrics']['balanced_mae']
+            ssim_fid = recon['metrics']['ssim']
+            mae_fid = recon['metrics']['mae']
+            state_fid = recon['metrics']['quantum_state']
             start = page * images_per_page
             end = min(start + images_per_page, num_images)
-            grid_thumbs = image_thumbs[start:end]
+            grid_thumbs = range(start, end)
             grid_html = ''.join([
-                '<div class="thumb {}" id="thumb-{}" onclick="selectImage({})"><img src="data:image/png;base64,{}"></div>'.format(
+                '<div class="thumb {}" id="thumb-{}" onclick="selectImage({})"><img src="/img/{}.png" loading="lazy"></div>'.format(
                     'selected' if i+start==index else '', i+start, i+start, img
                 ) for i, img in enumerate(grid_thumbs)
             ])
-            # Page selector: flex, fits below grid
-            page_selector = '<div class="page-selector-flex"><div class="page-selector" style="gap: 16px; display: flex; justify-content: center; flex-wrap: wrap;">' + ''.join([
-                f'<button type="button" class="page-btn {'active' if p==page else ''}" style="margin: 0 10px 10px 0; padding: 10px 22px; font-size: 1.15em;" onclick="gotoPage({p})">{p+1}</button>'
-                for p in range(num_pages)
-            ]) + '</div></div>'
+            page_selector = page_selector_html(page, num_pages)
+            prefetch_neighbouring_pages(page, num_pages)
             return render_template_string('''
 <!DOCTYPE html>
 <html lang="en">
@@ -299,6 +259,10 @@ function gotoPage(p) {
           <input type="range" id="shots-range" min="100" max="5000" step="100" value="{{ shots }}" oninput="syncNumber(this.value)">
           <input type="number" name="shots" id="shots" min="100" max="5000" step="100" value="{{ shots }}" oninput="syncSlider(this.value)">
         </div>
+        <div class="slider-input-wrap">
+          <label for="seed">Seed:</label>
+          <input type="number" name="seed" id="seed" min="0" value="{{ seed }}">
+        </div>
         <input type="hidden" name="index" id="index" value="{{ index }}">
         <input type="hidden" name="page" id="page" value="{{ page }}">
         <button type="submit">Reconstruct Image</button>
@@ -306,12 +270,12 @@ function gotoPage(p) {
     </div>
     <div class="img-block">
         <h3 style="font-size:1.5em;">Original Image</h3>
-        <img src="data:image/png;base64,{{ original_b64 }}" alt="Original Image"/>
+        <img src="{{ original_src }}" alt="Original Image"/>
     </div>
     <div class="img-block img-block-row">
         <div class="img-col">
             <h3 style="font-size:1.5em;">Reconstructed Image</h3>
-            <img src="data:image/png;base64,{{ retrieved_b64 }}" alt="Reconstructed Image"/>
+            <img src="{{ retrieved_src }}" alt="Reconstructed Image"/>
             <div style="margin-top: 10px; text-align: center; font-size: 1.1em;">
                 <span>Balanced Weighted MAE Fidelity: {{ '{:.4f}'.format(balanced_mae_fid) if balanced_mae_fid != 'N/A' else 'N/A' }}</span><br>
                 <span>SSIM Fidelity: {{ '{:.4f}'.format(ssim_fid) if ssim_fid != 'N/A' else 'N/A' }}</span><br>
@@ -321,8 +285,8 @@ function gotoPage(p) {
         </div>
         <div class="img-col diff-col">
             <h3 style="font-size:1.1em;">Difference</h3>
-            {% if diff_b64 %}
-            <img src="data:image/png;base64,{{ diff_b64 }}" alt="Difference Image" class="diff-img"/>
+            {% if diff_src %}
+            <img src="{{ diff_src }}" alt="Difference Image" class="diff-img"/>
             {% else %}
             <div style="color: #888; font-size: 1em;">N/A</div>
             {% endif %}
@@ -340,13 +304,14 @@ function gotoPage(p) {
 </div>
 </body>
 </html>
-''', shots=shots, index=index, page=page, original_b64=original_b64, retrieved_b64=retrieved_b64, grid_html=grid_html, page_selector=page_selector, balanced_mae_fid=balanced_mae_fid, ssim_fid=ssim_fid, mae_fid=mae_fid, state_fid=state_fid, diff_b64=diff_b64)
+''', shots=shots, seed=seed, index=index, page=page, original_src=original_src, retrieved_src=retrieved_src, grid_html=grid_html, page_selector=page_selector, balanced_mae_fid=balanced_mae_fid, ssim_fid=ssim_fid, mae_fid=mae_fid, state_fid=state_fid, diff_src=diff_src)
         except Exception as e:
             print(f"POST error: {e}")
             return f"<p>Error: {e}</p>"
 
     # GET request: show default or selected image
     page = 0
+    seed = DEFAULT_SEED
     index = 0
     shots = 1000
     try:
@@ -361,28 +326,29 @@ function gotoPage(p) {
         shots = int(request.args.get('shots', 1000))
     except Exception:
         shots = 1000
+    page = min(max(page, 0), num_pages - 1)
     try:
-        original_img = images[index]
+        original_img = get_image(index)
     except Exception:
-        original_img = images[0]
+        original_img = get_image(0)
         index = 0
     print(f"GET index: {index}, shots: {shots}, page: {page}")
     print(f"original_img type: {type(original_img)}, shape: {getattr(original_img, 'shape', None)}")
-    original_b64 = array_to_base64_img(original_img)
+    original_src = f'/img/{index}.png'
     if isinstance(original_img, np.ndarray) and original_img.shape == (8, 8):
         retrieved_img = original_img
-        retrieved_b64 = array_to_base64_img(original_img)
+        retrieved_src = original_src
     else:
         print(f"Warning: original_img is not shape (8,8): {original_img}")
         retrieved_img = np.zeros((8,8), dtype=np.uint8)
-        retrieved_b64 = array_to_base64_img(retrieved_img)
+        retrieved_src = png_data_uri(retrieved_img)
     # Compute difference image for GET
     try:
         diff_img = np.abs(original_img.astype(float) - retrieved_img.astype(float))
-        diff_b64 = array_to_base64_img(diff_img, size=1.5)
+        diff_src = png_data_uri(diff_img)
     except Exception as e:
         print(f"Diff error: {e}")
-        diff_b64 = None
+        diff_src = None
     # Compute fidelities for GET (showing original as both)
     try:
         balanced_mae_fid = balanced_weighted_mae(original_img, retrieved_img)
@@ -406,17 +372,14 @@ function gotoPage(p) {
         state_fid = 'N/A'
     start = page * images_per_page
     end = min(start + images_per_page, num_images)
-    grid_thumbs = image_thumbs[start:end]
+    grid_thumbs = range(start, end)
     grid_html = ''.join([
-        '<div class="thumb {}" id="thumb-{}" onclick="selectImage({})"><img src="data:image/png;base64,{}"></div>'.format(
+        '<div class="thumb {}" id="thumb-{}" onclick="selectImage({})"><img src="/img/{}.png" loading="lazy"></div>'.format(
             'selected' if i+start==index else '', i+start, i+start, img
         ) for i, img in enumerate(grid_thumbs)
     ])
-    # Page selector: flex, fits below grid
-    page_selector = '<div class="page-selector-flex"><div class="page-selector" style="gap: 16px; display: flex; justify-content: center; flex-wrap: wrap;">' + ''.join([
-        f'<button type="button" class="page-btn {'active' if p==page else ''}" style="margin: 0 10px 10px 0; padding: 10px 22px; font-size: 1.15em;" onclick="gotoPage({p})">{p+1}</button>'
-        for p in range(num_pages)
-    ]) + '</div></div>'
+    page_selector = page_selector_html(page, num_pages)
+    prefetch_neighbouring_pages(page, num_pages)
     # Use the same HTML/CSS for both GET and POST
     return render_template_string('''
 <!DOCTYPE html>
@@ -570,6 +533,10 @@ function gotoPage(p) {
           <input type="range" id="shots-range" min="100" max="5000" step="100" value="{{ shots }}" oninput="syncNumber(this.value)">
           <input type="number" name="shots" id="shots" min="100" max="5000" step="100" value="{{ shots }}" oninput="syncSlider(this.value)">
         </div>
+        <div class="slider-input-wrap">
+          <label for="seed">Seed:</label>
+          <input type="number" name="seed" id="seed" min="0" value="{{ seed }}">
+        </div>
         <input type="hidden" name="index" id="index" value="{{ index }}">
         <input type="hidden" name="page" id="page" value="{{ page }}">
         <button type="submit">Reconstruct Image</button>
@@ -577,12 +544,12 @@ function gotoPage(p) {
     </div>
     <div class="img-block">
         <h3 style="font-size:1.5em;">Original Image</h3>
-        <img src="data:image/png;base64,{{ original_b64 }}" alt="Original Image"/>
+        <img src="{{ original_src }}" alt="Original Image"/>
     </div>
     <div class="img-block img-block-row">
         <div class="img-col">
             <h3 style="font-size:1.5em;">Reconstructed Image</h3>
-            <img src="data:image/png;base64,{{ retrieved_b64 }}" alt="Reconstructed Image"/>
+            <img src="{{ retrieved_src }}" alt="Reconstructed Image"/>
             <div style="margin-top: 10px; text-align: center; font-size: 1.1em;">
                 <span>Balanced Weighted MAE Fidelity: {{ '{:.4f}'.format(balanced_mae_fid) if balanced_mae_fid != 'N/A' else 'N/A' }}</span><br>
                 <span>SSIM Fidelity: {{ '{:.4f}'.format(ssim_fid) if ssim_fid != 'N/A' else 'N/A' }}</span><br>
@@ -592,8 +559,8 @@ function gotoPage(p) {
         </div>
         <div class="img-col diff-col">
             <h3 style="font-size:1.1em;">Difference</h3>
-            {% if diff_b64 %}
-            <img src="data:image/png;base64,{{ diff_b64 }}" alt="Difference Image" class="diff-img"/>
+            {% if diff_src %}
+            <img src="{{ diff_src }}" alt="Difference Image" class="diff-img"/>
             {% else %}
             <div style="color: #888; font-size: 1em;">N/A</div>
             {% endif %}
@@ -618,7 +585,7 @@ if (window.location.protocol !== 'https:') {
 </script>
 </body>
 </html>
-''', shots=shots, index=index, page=page, original_b64=original_b64, retrieved_b64=retrieved_b64, grid_html=grid_html, page_selector=page_selector, balanced_mae_fid=balanced_mae_fid, ssim_fid=ssim_fid, mae_fid=mae_fid, state_fid=state_fid, diff_b64=diff_b64)
+''', shots=shots, seed=seed, index=index, page=page, original_src=original_src, retrieved_src=retrieved_src, grid_html=grid_html, page_selector=page_selector, balanced_mae_fid=balanced_mae_fid, ssim_fid=ssim_fid, mae_fid=mae_fid, state_fid=state_fid, diff_src=diff_src)
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5050, use_reloader=False)  # Disable debug mode
\ No newline at end of file
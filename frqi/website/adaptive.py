@@ -0,0 +1,166 @@
+import argparse
+import csv
+import math
+import statistics
+import sys
+import time
+import numpy as np
+from website.analytic import sample_counts
+from website.build_circuit import SYNTHESIS_MODES, circuit_template
+from website.decode import decode_counts, outcomes_to_counts
+from website.logic.batch_processing import metric_values
+from website.preprocess import dataset_size, get_image, image_to_angles, load_dataset, prepare_image
+from website.simulate import ENGINES, batched_outcome_streams, get_simulator
+
+# Usage: python -m website.adaptive --out adaptive.csv [--start 0] [--end 1000] [--metric ssim]
+#                                   [--target 0.01] [--increment 100] [--max-shots 2000]
+# Adaptive shot allocation: every image is sampled in increments, and after each increment
+# the uncertainty of its metric is estimated by a parametric bootstrap through the sqrt
+# decoder (resampling the observed outcome histogram). An image stops once the normal
+# confidence-interval half-width is at most --target, or at --max-shots. Rows are
+# (image, shots used, metric, half-width); the summary compares the shots spent with a
+# fixed --max-shots per image.
+#
+# The half-width uses an upper confidence bound on the bootstrap standard deviation, since
+# stopping on the noisy estimate itself stops exactly the images whose estimate came out low.
+#
+# Choosing --target: the half-width shrinks roughly as 1/sqrt(shots), so a target below what
+# most images reach at --max-shots saves nothing (the summary reports how many images hit
+# the cap). Run a few hundred images with --target 0, which samples every image up to
+# --max-shots and reports its HalfWidth there: images whose HalfWidth is below the target
+# can stop early, so a target near the median lets about half of them stop before the cap.
+
+METRICS = ('balanced_mae', 'mae', 'ssim', 'quantum_state')
+STD_BOUND_LEVEL = 0.95
+
+def std_upper_factor(resamples, level=STD_BOUND_LEVEL):
+    # sample std of `resamples` values times this is a `level` upper bound on the true std:
+    # sqrt(k / chi2_(1-level)(k)) with k = resamples - 1 (Wilson-Hilferty quantile)
+    k = resamples - 1
+    z = statistics.NormalDist().inv_cdf(1 - level)
+    quantile = k * (1 - 2 / (9 * k) + z * math.sqrt(2 / (9 * k))) ** 3
+    return math.sqrt(k / quantile)
+
+def bootstrap_half_width(originals, counts, shots, metric, rng=None, resamples=128, confidence=0.95):
+    # counts (images, outcomes) after shots (images,) -> half-width (images,) of the
+    # confidence interval of the metric: z times the upper bound (std_upper_factor) of its
+    # standard deviation over resamples multinomial redraws of the empirical outcome
+    # distribution. The standard error settles with far fewer redraws than percentile
+    # bounds, and the redraws dominate the cost.
+    rng = np.random.default_rng(rng)
+    counts = np.asarray(counts)
+    shots = np.asarray(shots, dtype=np.int64)
+    probs = counts / shots[:, None]
+    resampled = rng.multinomial(np.broadcast_to(shots[:, None], (len(shots), resamples)), probs[:, None, :])
+    values = metric_values(metric, originals, decode_counts(resampled, shots[:, None]))
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    return z * std_upper_factor(resamples) * values.std(axis=1, ddof=1)
+
+def adaptive_counts(originals, metric, target, simulator=None, engine='analytic', increment=100, min_shots=None,
+                    max_shots=2000, resamples=128, confidence=0.95, seed=None, synthesis='mcry'):
+    # originals (images, side, side) -> (shots used, metric value, half-width), each (images,).
+    # Active images advance in lockstep, so every round is one batched draw (one Aer job).
+    originals = np.asarray(originals)
+    num_images = len(originals)
+    angles = image_to_angles(originals).reshape(num_images, -1)
+    num_outcomes = 2 * angles.shape[1]
+    min_shots = increment if min_shots is None else min_shots
+    if resamples < 2:
+        raise ValueError(f"Need at least 2 bootstrap resamples, got {resamples}")
+    if not 1 <= increment <= max_shots or min_shots > max_shots:
+        raise ValueError(f"Need 1 <= increment <= max_shots and min_shots <= max_shots, got "
+                         f"increment={increment}, min_shots={min_shots}, max_shots={max_shots}")
+    rng = np.random.default_rng(seed)
+    if engine == 'aer':
+        simulator = simulator or get_simulator()
+        template = circuit_template(simulator, optimization_level=0, synthesis=synthesis,
+                                    num_pixels=angles.shape[1])
+    elif engine != 'analytic':
+        raise ValueError(f"Unknown engine: {engine}")
+
+    counts = np.zeros((num_images, num_outcomes), dtype=np.int64)
+    shots = np.zeros(num_images, dtype=np.int64)
+    half_width = np.full(num_images, np.inf)
+    active = np.arange(num_images)
+    taken = 0
+    while len(active):
+        step = min(increment, max_shots - taken)
+        if engine == 'aer':
+            outcomes = batched_outcome_streams(template, angles[active], step, simulator,
+                                               seed=int(rng.integers(2 ** 30)))
+            counts[active] += outcomes_to_counts(outcomes, num_outcomes)
+        else:
+            counts[active] += sample_counts(angles[active], step, rng=rng)
+        taken += step
+        shots[active] = taken
+        if taken < min_shots:
+            continue
+        half_width[active] = bootstrap_half_width(originals[active], counts[active], shots[active], metric, rng,
+                                                  resamples, confidence)
+        done = (half_width[active] <= target) | (taken >= max_shots)
+        active = active[~done]
+
+    values = metric_values(metric, originals, decode_counts(counts, shots))
+    return shots, values, half_width
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Adaptive per-image shot allocation for FRQI')
+    parser.add_argument('--out', required=True, help='CSV of per-image results')
+    parser.add_argument('--start', type=int, default=0)
+    parser.add_argument('--end', type=int, default=None, help='end index (exclusive), default: whole dataset')
+    parser.add_argument('--metric', choices=METRICS, default='ssim')
+    parser.add_argument('--target', type=float, default=0.01, help='confidence-interval half-width to stop at (see the header on choosing it)')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--increment', type=int, default=100, help='shots added per round')
+    parser.add_argument('--min-shots', type=int, default=None, help='shots before the first check (default: one increment)')
+    parser.add_argument('--max-shots', type=int, default=2000)
+    parser.add_argument('--resamples', type=int, default=128, help='bootstrap resamples per check (at least 2)')
+    parser.add_argument('--engine', choices=ENGINES, default='analytic')
+    parser.add_argument('--synthesis', choices=SYNTHESIS_MODES, default='mcry')
+    parser.add_argument('--image-size', type=int, default=None, help='FRQI register side (power of two)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=500, help='images sampled together')
+    args = parser.parse_args(argv)
+    if args.increment < 1 or args.max_shots < args.increment:
+        parser.error("need 1 <= --increment <= --max-shots")
+    if args.min_shots is not None and args.min_shots > args.max_shots:
+        parser.error("need --min-shots <= --max-shots")
+    if args.resamples < 2:
+        parser.error("need --resamples >= 2")
+    try:
+        prepare_image(get_image(0), args.image_size)
+    except ValueError as e:
+        parser.error(str(e))
+
+    images, _ = load_dataset()
+    end = dataset_size() if args.end is None else min(args.end, dataset_size())
+    began = time.time()
+    used = []
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('ImageIndex', 'Shots', args.metric, 'HalfWidth'))
+        for chunk_start in range(args.start, end, args.chunk_size):
+            indices = np.arange(chunk_start, min(chunk_start + args.chunk_size, end))
+            originals = prepare_image(images[indices], args.image_size)
+            # seeded per chunk start, so a range gives the same result however it is resumed
+            seed = np.random.SeedSequence([args.seed, int(chunk_start)])
+            shots, values, half_width = adaptive_counts(
+                originals, args.metric, args.target, engine=args.engine, increment=args.increment,
+                min_shots=args.min_shots, max_shots=args.max_shots, resamples=args.resamples,
+                confidence=args.confidence, seed=seed, synthesis=args.synthesis)
+            writer.writerows((int(i), int(s), float(v), float(h)) for i, s, v, h in zip(indices, shots, values,
+                                                                                        half_width))
+            f.flush()
+            used.extend(shots.tolist())
+            print(f"{len(used)}/{end - args.start} images, {time.time() - began:.1f}s", flush=True)
+
+    used = np.array(used)
+    fixed = len(used) * args.max_shots
+    print(f"{len(used)} images: mean {used.mean():.0f} shots, median {np.median(used):.0f}, "
+          f"{np.mean(used >= args.max_shots):.1%} stopped at --max-shots")
+    print(f"Total {used.sum()} shots vs {fixed} at a fixed {args.max_shots} per image "
+          f"({1 - used.sum() / fixed:.1%} saved)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,10 @@
 import numpy as np
-import torch
-import torch.nn.functional as F
-from skimage.metrics import structural_similarity as ssim
-from qiskit.quantum_info import Statevector, state_fidelity
 
 
 def balanced_weighted_mae(original, retrieved):
-    # Convert to torch tensors and normalize
-    orig = torch.tensor(original, dtype=torch.float32) / 255.0
-    retr = torch.tensor(retrieved, dtype=torch.float32) / 255.0
+    # Normalize to [0, 1] in float32
+    orig = np.asarray(original, dtype=np.float32) / np.float32(255.0)
+    retr = np.asarray(retrieved, dtype=np.float32) / np.float32(255.0)
 
     # Create a mask to ignore all-black pixels in the original
     mask = (orig > 0)
@@ -17,12 +13,12 @@ def balanced_weighted_mae(original, retrieved):
     orig_masked = orig[mask]
     retr_masked = retr[mask]
 
-    if orig_masked.numel() == 0:
+    if orig_masked.size == 0:
         return 0.0  # or 1.0 depending on desired behavior for all-black
 
     # Compute MAE on masked values
-    loss = F.l1_loss(orig_masked, retr_masked)
-    return 1.0 - loss.item()  # Higher = better fidelity
+    loss = np.abs(orig_masked - retr_masked).mean(dtype=np.float32)
+    return 1.0 - float(loss)  # Higher = better fidelity
 
 def mae(original, retrieved, normalize=True):
     orig = np.asarray(original, dtype=np.float32)
@@ -37,14 +33,39 @@ def mae(original, retrieved, normalize=True):
     return float(1.0 - mae_val)
 
 def SSIM(original, retrieved):
-    return ssim(original, retrieved, data_range=255)
+    # same value as skimage.metrics.structural_similarity(original, retrieved, data_range=255)
+    if np.shape(original) != np.shape(retrieved):
+        raise ValueError(f"shape mismatch: original {np.shape(original)} vs retrieved {np.shape(retrieved)}")
+    return float(SSIM_batch(original, retrieved))
 
 def quantum_state_fidelity(original, retrieved):
-    if isinstance(original, torch.Tensor):
+    # torch tensors are accepted without importing torch
+    if hasattr(original, 'detach'):
         original = original.detach().cpu().numpy()
-    if isinstance(retrieved, torch.Tensor):
+    if hasattr(retrieved, 'detach'):
         retrieved = retrieved.detach().cpu().numpy()
 
+    original = np.asarray(original)
+    retrieved = np.asarray(retrieved)
+    if _is_complex(original) or _is_complex(retrieved):
+        return _statevector_fidelity(original, retrieved)
+
+    # Real amplitudes: the fidelity of the normalized states is the squared normalized
+    # dot product, no Statevector needed
+    vec1 = original.reshape(-1).astype(np.float64)
+    vec2 = retrieved.reshape(-1).astype(np.float64)
+    norm1 = np.dot(vec1, vec1)
+    norm2 = np.dot(vec2, vec2)
+    if norm1 == 0 or norm2 == 0:
+        return 0.0
+    return float(np.dot(vec1, vec2) ** 2 / (norm1 * norm2))
+
+def _is_complex(arr):
+    return np.iscomplexobj(arr) and np.any(np.imag(arr) != 0)
+
+def _statevector_fidelity(original, retrieved):
+    from qiskit.quantum_info import Statevector, state_fidelity
+
     vec1 = original.flatten().astype(np.complex128)
     vec2 = retrieved.flatten().astype(np.complex128)
 
@@ -59,4 +80,76 @@ def quantum_state_fidelity(original, retrieved):
     sv2 = Statevector(vec2)
 
     fid = state_fidelity(sv1, sv2)
-    return float(fid)
\ No newline at end of file
+    return float(fid)
+
+# Batch metrics: originals (..., 8, 8) against retrieved images with extra axes, e.g.
+# originals (images, 8, 8) and retrieved (images, shots, 8, 8) -> metric (images, shots).
+# Original-image statistics are computed once per original and broadcast over the
+# shot axis.
+
+def _align(original, retrieved):
+    orig = np.asarray(original)
+    retr = np.asarray(retrieved)
+    while orig.ndim < retr.ndim:
+        orig = np.expand_dims(orig, axis=orig.ndim - 2)
+    return orig, retr
+
+def balanced_weighted_mae_batch(original, retrieved):
+    orig, retr = _align(original, retrieved)
+    orig = orig.astype(np.float32) / 255.0
+    retr = retr.astype(np.float32) / 255.0
+    mask = orig > 0
+    masked_count = mask.sum(axis=(-2, -1))
+    loss = (np.abs(orig - retr) * mask).sum(axis=(-2, -1), dtype=np.float32)
+    loss = loss / np.maximum(masked_count, 1)
+    # all-black originals score 0.0, as in balanced_weighted_mae
+    return np.where(masked_count > 0, 1.0 - loss.astype(float), 0.0)
+
+def mae_batch(original, retrieved, normalize=True):
+    orig, retr = _align(original, retrieved)
+    orig = orig.astype(np.float32)
+    retr = retr.astype(np.float32)
+    mae_val = np.abs(orig - retr).mean(axis=(-2, -1))
+    if normalize:
+        mae_val = mae_val / 255.0
+    return 1.0 - mae_val.astype(float)
+
+def _window_means(img, win_size):
+    # mean over every win_size x win_size window lying fully inside the image; these are
+    # exactly the positions skimage keeps after cropping its uniform filter output
+    windows = np.lib.stride_tricks.sliding_window_view(img, (win_size, win_size), axis=(-2, -1))
+    return windows.mean(axis=(-2, -1))
+
+def SSIM_batch(original, retrieved, data_range=255, win_size=7):
+    # Vectorized skimage.metrics.structural_similarity with its defaults
+    # (uniform 7x7 window, sample covariance, K1=0.01, K2=0.03)
+    orig, retr = _align(original, retrieved)
+    if min(orig.shape[-2:]) < win_size:
+        raise ValueError(f"win_size {win_size} exceeds image size {orig.shape[-2:]}")
+    orig = orig.astype(np.float64)
+    retr = retr.astype(np.float64)
+    cov_norm = win_size ** 2 / (win_size ** 2 - 1)
+    ux = _window_means(orig, win_size)
+    vx = cov_norm * (_window_means(orig * orig, win_size) - ux * ux)
+    uy = _window_means(retr, win_size)
+    vy = cov_norm * (_window_means(retr * retr, win_size) - uy * uy)
+    vxy = cov_norm * (_window_means(orig * retr, win_size) - ux * uy)
+    c1 = (0.01 * data_range) ** 2
+    c2 = (0.03 * data_range) ** 2
+    s = ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux ** 2 + uy ** 2 + c1) * (vx + vy + c2))
+    return s.mean(axis=(-2, -1))
+
+def quantum_state_fidelity_batch(original, retrieved):
+    orig, retr = _align(original, retrieved)
+    if np.iscomplexobj(orig) or np.iscomplexobj(retr):
+        orig = orig.astype(np.complex128)
+        retr = retr.astype(np.complex128)
+    else:
+        orig = orig.astype(np.float64)
+        retr = retr.astype(np.float64)
+    norm1 = (np.abs(orig) ** 2).sum(axis=(-2, -1))
+    norm2 = (np.abs(retr) ** 2).sum(axis=(-2, -1))
+    overlap = np.abs((np.conj(orig) * retr).sum(axis=(-2, -1))) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fid = overlap / (norm1 * norm2)
+    return np.where((norm1 > 0) & (norm2 > 0), fid, 0.0)
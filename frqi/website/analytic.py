@@ -0,0 +1,76 @@
+import numpy as np
+
+# Ideal (noise-free) FRQI sampling without building or simulating a circuit.
+# Outcome integers follow Aer's bit order: outcome = pixels * colour_qubit + position.
+
+def frqi_probabilities(angles):
+    # angles (..., pixels) -> outcome probabilities (..., 2 * pixels)
+    angles = np.asarray(angles, dtype=float)
+    n = angles.shape[-1]
+    return np.concatenate([np.cos(angles) ** 2, np.sin(angles) ** 2], axis=-1) / n
+
+def sample_from_probabilities(probs, shots, rng=None):
+    # shots may be a scalar or a 1-D shot grid; a grid adds an axis before the outcomes,
+    # so probs (B, K) with shots (S,) gives counts (B, S, K). Every grid point is
+    # an independent draw, exactly as if each shot count had been run separately.
+    rng = np.random.default_rng(rng)
+    probs = np.asarray(probs, dtype=float)
+    shots = np.asarray(shots, dtype=np.int64)
+    if shots.ndim:
+        probs = probs[..., None, :]
+    return rng.multinomial(shots, probs)
+
+def sample_counts(angles, shots, rng=None):
+    return sample_from_probabilities(frqi_probabilities(angles), shots, rng=rng)
+
+def segment_counts(outcomes, shot_counts, num_outcomes=128):
+    # Cut a stream of sum(shot_counts) outcomes into consecutive, disjoint segments, one
+    # per grid point: (..., sum(shots)) -> (..., S, num_outcomes). Segments never share
+    # shots, so every grid point is an independent sample.
+    outcomes = np.asarray(outcomes, dtype=np.int64)
+    shot_counts = np.asarray(shot_counts, dtype=np.int64)
+    lead = outcomes.shape[:-1]
+    flat = outcomes.reshape(-1, outcomes.shape[-1])[:, :shot_counts.sum()]
+    num_streams = flat.shape[0]
+    num_grid = len(shot_counts)
+    segment = np.repeat(np.arange(num_grid), shot_counts)
+    keys = (np.arange(num_streams)[:, None] * num_grid + segment) * num_outcomes + flat
+    counts = np.bincount(keys.ravel(), minlength=num_streams * num_grid * num_outcomes)
+    return counts.reshape(lead + (num_grid, num_outcomes))
+
+# Nested sweeps: every grid point is a prefix of one shot stream of length max(shots).
+# Counts are therefore correlated along the shots axis (each grid point extends the
+# previous one), which is what convergence plots of a single reconstruction want,
+# and the sampling cost is max(shots) rather than sum(shots).
+
+def nested_counts_from_outcomes(outcomes, shot_counts, num_outcomes=128):
+    # outcomes (..., max_shots) integer stream -> cumulative counts (..., S, num_outcomes)
+    outcomes = np.asarray(outcomes, dtype=np.int64)
+    shot_counts = np.asarray(shot_counts, dtype=np.int64)
+    order = np.argsort(shot_counts)
+    sorted_shots = shot_counts[order]
+    lead = outcomes.shape[:-1]
+    flat = outcomes.reshape(-1, outcomes.shape[-1])[:, :sorted_shots[-1]]
+    num_streams = flat.shape[0]
+    num_grid = len(sorted_shots)
+    # segment k holds the shots between grid points k-1 and k
+    segment = np.searchsorted(sorted_shots, np.arange(flat.shape[1]), side='right')
+    keys = (np.arange(num_streams)[:, None] * num_grid + segment) * num_outcomes + flat
+    counts = np.bincount(keys.ravel(), minlength=num_streams * num_grid * num_outcomes)
+    counts = counts.reshape(num_streams, num_grid, num_outcomes).cumsum(axis=1)
+    result = np.empty_like(counts)
+    result[:, order] = counts
+    return result.reshape(lead + (num_grid, num_outcomes))
+
+def sample_nested(probs, shot_counts, rng=None):
+    # Same distribution as nested_counts_from_outcomes on a sampled stream, drawn as
+    # multinomial increments between consecutive grid points
+    rng = np.random.default_rng(rng)
+    probs = np.asarray(probs, dtype=float)
+    shot_counts = np.asarray(shot_counts, dtype=np.int64)
+    order = np.argsort(shot_counts)
+    increments = np.diff(shot_counts[order], prepend=0)
+    counts = rng.multinomial(increments, probs[..., None, :]).cumsum(axis=-2)
+    result = np.empty_like(counts)
+    result[..., order, :] = counts
+    return result
@@ -1,23 +1,24 @@
 from flask import Flask
-from qiskit_aer import AerSimulator
-
-simulator = AerSimulator()
-progress = {'done': 0, 'total': 1000, 'status': 'idle'}
+from website.result_cache import ResultCache
+from website.logic.jobs import JobScheduler
 
 def create_app():
     app = Flask(__name__)
-    app.simulator = simulator
-    app.progress = progress
+    app.result_cache = ResultCache()
+    # the shared AerSimulator is created on the first job that needs it
+    app.scheduler = JobScheduler(cache=app.result_cache)
 
     from website.routes.main import main_bp
     from website.routes.batch import batch_bp
     from website.routes.inspect import inspect_bp
     from website.routes.debug import debug_bp
+    from website.routes.images import images_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(batch_bp)
     app.register_blueprint(inspect_bp)
     app.register_blueprint(debug_bp)
+    app.register_blueprint(images_bp)
 
     return app
 
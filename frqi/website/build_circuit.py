@@ -1,10 +1,85 @@
-from qiskit import QuantumRegister, ClassicalRegister, QuantumCircuit
-from .frqi_utils import frqi
+import numpy as np
+import threading
+from .frqi_utils import frqi, hadamard, multiplexed_ry, ucr_angles
 
-def build_circuit(angles):
-    qr = QuantumRegister(7, 'q')
-    cr = ClassicalRegister(7, 'c')
+# 'mcry': one 2n-controlled RY gate per pixel with X flips (reference construction)
+# 'ucr': Gray-code uniformly controlled RY, one RY + one CNOT per pixel
+SYNTHESIS_MODES = ('mcry', 'ucr')
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+# qiskit is imported inside the functions, so importing this module (e.g. for
+# SYNTHESIS_MODES) stays cheap. A 2^n x 2^n image uses 2n position qubits (0..2n-1,
+# bit k of the pixel index on qubit k) and a colour qubit 2n.
+
+def position_qubits(num_pixels):
+    # -> number of position qubits for num_pixels (a power of two, at least 16: Aer binds
+    # the transpiled 2x2 mcry template as a single experiment with wrong amplitudes)
+    num_qubits = int(num_pixels).bit_length() - 1
+    if num_pixels < 16 or 1 << num_qubits != num_pixels:
+        raise ValueError(f"FRQI needs a power-of-two number of pixels, at least 16 (4x4), got {num_pixels}")
+    return num_qubits
+
+def _frqi_circuit(values, synthesis):
+    # values are the pixel angles, or for 'ucr' the multiplexor rotations (ucr_angles)
+    from qiskit import QuantumRegister, ClassicalRegister, QuantumCircuit
+
+    num_qubits = position_qubits(len(values))
+    positions = list(range(num_qubits))
+    qr = QuantumRegister(num_qubits + 1, 'q')
+    cr = ClassicalRegister(num_qubits + 1, 'c')
     qc = QuantumCircuit(qr, cr)
-    frqi(qc, [0, 1, 2, 3, 4, 5], 6, angles)
-    qc.measure([0, 1, 2, 3, 4, 5, 6], [0, 1, 2, 3, 4, 5, 6])
-    return qc
\ No newline at end of file
+    if synthesis == 'mcry':
+        frqi(qc, positions, num_qubits, values)
+    elif synthesis == 'ucr':
+        hadamard(qc, positions)
+        multiplexed_ry(qc, positions, num_qubits, values)
+    else:
+        raise ValueError(f"Unknown synthesis mode: {synthesis}")
+    qc.measure(list(range(num_qubits + 1)), list(range(num_qubits + 1)))
+    return qc
+
+def build_circuit(angles, synthesis='mcry'):
+    if synthesis == 'ucr':
+        return _frqi_circuit(ucr_angles(angles), synthesis)
+    return _frqi_circuit(angles, synthesis)
+
+def build_template(synthesis='mcry', num_pixels=64):
+    # Same circuit as build_circuit with its parameters left free: the pixel angles for
+    # 'mcry', the multiplexor rotations for 'ucr' (bound from the angles numerically, so
+    # the template stays linear in the pixel count)
+    from qiskit.circuit import ParameterVector
+
+    theta = ParameterVector('theta', num_pixels)
+    return _frqi_circuit(theta, synthesis), theta
+
+def circuit_template(backend, optimization_level=0, synthesis='mcry', num_pixels=64):
+    # The FRQI structure never changes, so it is built and transpiled once per backend,
+    # optimization level, synthesis mode and image size and then bound per image.
+    # -> (transpiled circuit, parameters, synthesis)
+    from qiskit import transpile
+
+    key = (backend.name, optimization_level, synthesis, num_pixels)
+    with _templates_lock:
+        if key not in _templates:
+            qc, theta = build_template(synthesis, num_pixels)
+            _templates[key] = (transpile(qc, backend, optimization_level=optimization_level), theta, synthesis)
+        return _templates[key]
+
+def template_values(template, angles):
+    # pixel angles (..., pixels) -> the values bound to the template's parameters
+    _, _, synthesis = template
+    angles = np.asarray(angles, dtype=float)
+    return ucr_angles(angles) if synthesis == 'ucr' else angles
+
+def bind_circuit(template, angles):
+    t_qc, theta, _ = template
+    return t_qc.assign_parameters({theta: list(template_values(template, angles))})
+
+def parameter_binds(template, angles_batch):
+    # Aer run(..., parameter_binds=...) entry that evaluates the template for every
+    # row of angles_batch (images, pixels) in a single job
+    _, theta, _ = template
+    values = template_values(template, angles_batch)
+    return [{theta[k]: values[:, k].tolist() for k in range(len(theta))}]
@@ -0,0 +1,52 @@
+import argparse
+import sys
+import numpy as np
+from qiskit import transpile
+from qiskit.quantum_info import Statevector
+from website.build_circuit import SYNTHESIS_MODES, build_circuit
+from website.preprocess import load_and_process_image
+
+# Usage: python -m website.circuit_report [--image N] [--image-size 16] [--basis u,cx]
+# Compares gate counts and depth of the FRQI synthesis modes after decomposition and
+# checks that they prepare the same state.
+
+def circuit_stats(qc, basis_gates, optimization_level=0):
+    t_qc = transpile(qc, basis_gates=basis_gates, optimization_level=optimization_level)
+    ops = t_qc.count_ops()
+    ops.pop('measure', None)
+    ops.pop('barrier', None)
+    return {'depth': t_qc.depth(), 'size': sum(ops.values()), 'cx': ops.get('cx', 0), 'ops': dict(ops)}
+
+def prepared_state(angles, synthesis):
+    qc = build_circuit(angles, synthesis)
+    return Statevector(qc.remove_final_measurements(inplace=False))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='FRQI synthesis comparison')
+    parser.add_argument('--image', type=int, default=0, help='dataset index to encode')
+    parser.add_argument('--image-size', type=int, default=None, help='encode the image at this (power-of-two) size')
+    parser.add_argument('--basis', default='u,cx', help='comma-separated basis gates')
+    parser.add_argument('--optimization-level', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    _, angles = load_and_process_image(args.image, args.image_size)
+    basis_gates = args.basis.split(',')
+    print(f"Image {args.image} ({len(angles)} pixels), basis {basis_gates}, "
+          f"optimization level {args.optimization_level}")
+    print(f"{'synthesis':<10} {'depth':>8} {'gates':>8} {'cx':>8}")
+    states = {}
+    for synthesis in SYNTHESIS_MODES:
+        stats = circuit_stats(build_circuit(angles, synthesis), basis_gates, args.optimization_level)
+        print(f"{synthesis:<10} {stats['depth']:>8} {stats['size']:>8} {stats['cx']:>8}")
+        states[synthesis] = prepared_state(angles, synthesis)
+
+    reference = states[SYNTHESIS_MODES[0]]
+    ok = True
+    for synthesis in SYNTHESIS_MODES[1:]:
+        max_diff = np.max(np.abs(states[synthesis].data - reference.data))
+        print(f"{synthesis} vs {SYNTHESIS_MODES[0]}: max amplitude difference {max_diff:.3e}")
+        ok = ok and max_diff < 1e-9
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
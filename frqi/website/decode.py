@@ -0,0 +1,45 @@
+import numpy as np
+
+# FRQI decoding on integer outcome histograms. For an image of P pixels, outcome
+# o = P * colour_qubit + position (Aer bit order); for 8x8 images the '1' + format(idx, '06b')
+# bitstring is outcome 64 + idx.
+
+def counts_to_array(counts, num_outcomes=128):
+    # Aer counts dict, keyed by hex ('0x4f', from result.data()['counts']) or by
+    # bitstring ('1001111', from result.get_counts()) -> histogram (num_outcomes,)
+    arr = np.zeros(num_outcomes, dtype=np.int64)
+    for key, value in counts.items():
+        key = key.replace(' ', '')
+        outcome = int(key, 16) if key.startswith('0x') else int(key, 2)
+        arr[outcome] += value
+    return arr
+
+def outcomes_to_counts(outcomes, num_outcomes=128):
+    # outcomes (..., shots) integer samples -> histograms (..., num_outcomes)
+    outcomes = np.asarray(outcomes, dtype=np.int64)
+    lead = outcomes.shape[:-1]
+    flat = outcomes.reshape(-1, outcomes.shape[-1])
+    offsets = np.arange(flat.shape[0])[:, None] * num_outcomes
+    counts = np.bincount((flat + offsets).ravel(), minlength=flat.shape[0] * num_outcomes)
+    return counts.reshape(lead + (num_outcomes,))
+
+def image_side(num_pixels):
+    side = int(np.sqrt(num_pixels))
+    if side * side != num_pixels:
+        raise ValueError(f"{num_pixels} pixels do not form a square image")
+    return side
+
+def decode_counts(counts, shots=None):
+    # counts (..., 2 * side**2) -> reconstructed images (..., side, side), e.g. a full
+    # (images, shot grid, 128) tensor decodes to (images, shot grid, 8, 8).
+    # shots broadcasts against the leading axes and defaults to the histogram totals.
+    counts = np.asarray(counts)
+    num_pixels = counts.shape[-1] // 2
+    side = image_side(num_pixels)
+    if shots is None:
+        shots = counts.sum(axis=-1)
+    shots = np.asarray(shots, dtype=float)
+    # a pixel's colour-1 outcome has probability sin^2(theta) / pixels, sin(theta) = value / 255
+    retrieved = np.sqrt(counts[..., num_pixels:] / shots[..., None])
+    retrieved_img = (retrieved * float(side) * 255.0).astype(int)
+    return retrieved_img.reshape(counts.shape[:-1] + (side, side))
@@ -4,8 +4,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')
 import numpy as np
 import matplotlib.pyplot as plt
 from frqi.website.preprocess import load_and_process_image
-from frqi.website.build_circuit import build_circuit
-from qiskit import transpile
+from frqi.website.build_circuit import bind_circuit, circuit_template
+from frqi.website.decode import counts_to_array, decode_counts
 from qiskit_aer import AerSimulator
 
 # Usage: python frqi_compare_shots.py <image_index> <shots>
@@ -23,18 +23,11 @@ image = images[image_index]
 # Helper to run FRQI encode/decode for a given number of shots
 def frqi_output_img(image_index, shots):
     images, angles = load_and_process_image(image_index)
-    qc = build_circuit(angles)
     simulator = AerSimulator()
-    t_qc = transpile(qc, simulator, optimization_level=0)
+    t_qc = bind_circuit(circuit_template(simulator, optimization_level=0), angles)
     result = simulator.run(t_qc, shots=shots).result()
-    counts = result.get_counts()
-    retrieved = np.zeros((64,), dtype=float)
-    for idx in range(64):
-        key = '1' + format(idx, '06b')
-        freq = counts.get(key, 0)
-        retrieved[idx] = np.sqrt(freq / shots) if freq else 0.0
-    retrieved_img = (retrieved * 8.0 * 255.0).astype(int).reshape((8, 8))
-    return retrieved_img
+    counts = result.data()['counts']
+    return decode_counts(counts_to_array(counts), shots)
 
 # Generate output image for the given shot count
 img1 = frqi_output_img(image_index, shots1)
@@ -1,5 +1,4 @@
 import numpy as np
-from qiskit.circuit.library import RYGate
 
 def hadamard(circ, n):
     for i in n:
@@ -14,13 +13,16 @@ def change(state, new_state):
     return c.astype(int) if len(c) > 0 else c
 
 def binary(circ, state, new_state):
+    # bitstrings are MSB first, position qubit k holds bit k
     c = change(state, new_state)
     if len(c) > 0:
-        circ.x(np.abs(c - 5))
+        circ.x(len(state) - 1 - c)
     else:
         pass
 
 def cnri(circ, n, t, theta):
+    from qiskit.circuit.library import RYGate
+
     controls = len(n)
     cry = RYGate(2 * theta).control(controls)
     aux = np.append(n, t).tolist()
@@ -28,13 +30,50 @@ def cnri(circ, n, t, theta):
 
 def frqi(circ, n, t, angles):
     hadamard(circ, n)
+    width = len(n)
     j = 0
     for i in angles:
-        state = '{0:06b}'.format(j - 1)
-        new_state = '{0:06b}'.format(j)
+        state = '{0:0{1}b}'.format(j - 1, width)
+        new_state = '{0:0{1}b}'.format(j, width)
         if j == 0:
             cnri(circ, n, t, i)
         else:
             binary(circ, state, new_state)
             cnri(circ, n, t, i)
-        j += 1
\ No newline at end of file
+        j += 1
+
+def gray_code(k):
+    return k ^ (k >> 1)
+
+def walsh_hadamard(x):
+    # Unnormalized fast Walsh-Hadamard transform along the last axis (length 2^k):
+    # out[..., i] = sum_j (-1)^popcount(i & j) * x[..., j], in O(m log m)
+    x = np.array(x, dtype=float)
+    m = x.shape[-1]
+    h = 1
+    while h < m:
+        pairs = x.reshape(x.shape[:-1] + (m // (2 * h), 2, h))
+        low = pairs[..., 0, :].copy()
+        pairs[..., 0, :] += pairs[..., 1, :]
+        pairs[..., 1, :] = low - pairs[..., 1, :]
+        h *= 2
+    return x
+
+def ucr_angles(angles):
+    # Solve for the RY angles of the Gray-code multiplexor: control state j must see a
+    # total rotation of 2*theta_j = sum_i (-1)^popcount(j & g_i) * phi_i. That matrix
+    # is a Walsh-Hadamard matrix with Gray-ordered columns and is orthogonal up to a
+    # factor of m, so phi is a fast transform of the rotations. Works on (..., m).
+    rotations = 2 * np.asarray(angles, dtype=float)
+    m = rotations.shape[-1]
+    return walsh_hadamard(rotations)[..., gray_code(np.arange(m))] / m
+
+def multiplexed_ry(circ, n, t, phis):
+    # m RY gates on the target and m CNOTs, where the CNOT after step i is controlled
+    # by the qubit whose bit flips between g_i and g_(i+1) (mod m). phis may be
+    # parameters, which is how the circuit template is built.
+    m = len(phis)
+    for i, phi in enumerate(phis):
+        circ.ry(phi, t)
+        changed = gray_code(i) ^ gray_code((i + 1) % m)
+        circ.cx(n[changed.bit_length() - 1], t)
@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Usage: python -m website.import_budget [--budget 1.0] [--runs 5]
+# Times `from website.app import create_app; create_app()` in fresh interpreters and
+# fails (exit code 1) when the median exceeds the budget or a heavy dependency gets
+# imported at startup.
+
+HEAVY_MODULES = ('qiskit', 'qiskit_aer', 'matplotlib', 'scipy', 'skimage', 'torch', 'pandas')
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+from website.app import create_app
+create_app()
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+''' % (HEAVY_MODULES,)
+
+def measure_startup(runs=5):
+    # -> (list of startup times in seconds, heavy modules loaded by the last run)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    times, loaded = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', _PROBE], cwd=root, env=env, check=True,
+                             capture_output=True, text=True).stdout
+        probe = json.loads(out.strip().splitlines()[-1])
+        times.append(probe['seconds'])
+        loaded = probe['loaded']
+    return times, loaded
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='create_app import-time budget')
+    parser.add_argument('--budget', type=float, default=1.0, help='maximum median startup time in seconds')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    times, loaded = measure_startup(args.runs)
+    median = statistics.median(times)
+    print(f"create_app startup over {args.runs} runs: median {median:.3f}s, "
+          f"min {min(times):.3f}s, max {max(times):.3f}s (budget {args.budget:.3f}s)")
+    ok = median <= args.budget
+    if not ok:
+        print("FAIL: startup exceeds the budget")
+    if loaded:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(loaded)}")
+        ok = False
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
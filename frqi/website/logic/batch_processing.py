@@ -1,61 +1,272 @@
 import concurrent.futures
+import concurrent.futures.process
+import multiprocessing
+import os
+import threading
 import numpy as np
-import csv
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from website.preprocess import load_and_process_image
-from website.build_circuit import build_circuit
-from website.analysis import SSIM, balanced_weighted_mae, mae, quantum_state_fidelity
-from qiskit import transpile
-from website.plot import plot_metrics
-
-def process_image(i, images, shot_counts, simulator, metric):
-    try:
-        rows = []
-        metric_sums = np.zeros_like(shot_counts, dtype=float)
-        _, angles = load_and_process_image(i)
-        qc = build_circuit(angles)
-        t_qc = transpile(qc, simulator, optimization_level=0)
-
-        for j, shots in enumerate(shot_counts):
-            result = simulator.run(t_qc, shots=shots).result()
-            counts = result.get_counts()
-            retrieved = np.zeros((64,), dtype=float)
-            for idx in range(64):
-                key = '1' + format(idx, '06b')
-                freq = counts.get(key, 0)
-                retrieved[idx] = np.sqrt(freq / shots) if freq else 0.0
-            retrieved_img = (retrieved * 8.0 * 255.0).astype(int).reshape((8, 8))
-
-            if metric == 'balanced_mae':
-                value = balanced_weighted_mae(images[i], retrieved_img)
-            elif metric == 'mae':
-                value = mae(images[i], retrieved_img)
-            elif metric == 'ssim':
-                value = SSIM(images[i], retrieved_img)
-            elif metric == 'quantum_state':
-                value = quantum_state_fidelity(images[i], retrieved_img)
-            else:
-                raise ValueError(f"Unknown metric: {metric}")
+from website import neqr
+from website.preprocess import image_to_angles, load_and_process_image, load_dataset, prepare_image
+from website.build_circuit import bind_circuit, circuit_template
+from website.analysis import SSIM_batch, balanced_weighted_mae_batch, mae_batch, quantum_state_fidelity_batch
+from website.analytic import (frqi_probabilities, nested_counts_from_outcomes, sample_counts,
+                              sample_from_probabilities, sample_nested, segment_counts)
+from website.simulate import (ENCODERS, batched_outcome_streams, batched_probabilities, outcome_probabilities,
+                              outcome_stream)
+from website.decode import counts_to_array, decode_counts
+from website.results import ResultWriter, RunningStats
+from website.result_cache import image_hash
+
+def simulate_counts(angles, shot_counts, simulator, engine='aer', seed=None, sweep='per_shot', synthesis='mcry'):
+    # Outcome histograms for every shot count of one image, shape (len(shot_counts), 2 * pixels)
+    num_outcomes = 2 * len(angles)
+    if engine == 'aer':
+        template = circuit_template(simulator, optimization_level=0, synthesis=synthesis, num_pixels=len(angles))
+        t_qc = bind_circuit(template, angles)
+        if sweep == 'per_shot':
+            count_grid = np.zeros((len(shot_counts), num_outcomes), dtype=np.int64)
+            for j, shots in enumerate(shot_counts):
+                seed_j = None if seed is None else seed + j
+                result = simulator.run(t_qc, shots=int(shots), seed_simulator=seed_j).result()
+                count_grid[j] = counts_to_array(result.data()['counts'], num_outcomes)
+        elif sweep == 'distribution':
+            # simulate once, then one independent multinomial draw per shot count
+            probs = outcome_probabilities(t_qc, simulator)
+            count_grid = sample_from_probabilities(probs, shot_counts, rng=seed)
+        elif sweep == 'nested':
+            # one stream of max(shots) outcomes, grid points are its prefixes
+            outcomes = outcome_stream(t_qc, int(np.max(shot_counts)), simulator, seed=seed)
+            count_grid = nested_counts_from_outcomes(outcomes, shot_counts, num_outcomes)
+        else:
+            raise ValueError(f"Unknown sweep mode: {sweep}")
+    elif engine == 'analytic':
+        if sweep == 'nested':
+            count_grid = sample_nested(frqi_probabilities(angles), shot_counts, rng=seed)
+        else:
+            # one multinomial draw per shot count, all from the closed-form distribution
+            count_grid = sample_counts(angles, shot_counts, rng=seed)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+    return count_grid
+
+def simulate_counts_batch(angles_batch, shot_counts, simulator, engine='aer', seed=None, sweep='per_shot',
+                          synthesis='mcry'):
+    # Same as simulate_counts for a batch of images, shape (images, len(shot_counts), 2 * pixels),
+    # with every image and shot count submitted to Aer as a single job
+    angles_batch = np.asarray(angles_batch, dtype=float)
+    num_pixels = angles_batch.shape[-1]
+    if engine == 'aer':
+        template = circuit_template(simulator, optimization_level=0, synthesis=synthesis, num_pixels=num_pixels)
+        if sweep == 'per_shot':
+            # sum(shots) per image, cut into disjoint segments: each grid point is still an
+            # independent sample of its own size, as with one run per shot count
+            outcomes = batched_outcome_streams(template, angles_batch, int(np.sum(shot_counts)), simulator, seed)
+            return segment_counts(outcomes, shot_counts, 2 * num_pixels)
+        elif sweep == 'distribution':
+            probs = batched_probabilities(template, angles_batch, simulator)
+            return sample_from_probabilities(probs, shot_counts, rng=seed)
+        elif sweep == 'nested':
+            outcomes = batched_outcome_streams(template, angles_batch, int(np.max(shot_counts)), simulator, seed)
+            return nested_counts_from_outcomes(outcomes, shot_counts, 2 * num_pixels)
+        else:
+            raise ValueError(f"Unknown sweep mode: {sweep}")
+    elif engine == 'analytic':
+        probs = frqi_probabilities(angles_batch)
+        if sweep == 'nested':
+            return sample_nested(probs, shot_counts, rng=seed)
+        return sample_from_probabilities(probs, shot_counts, rng=seed)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+def simulate_image(image, shot_counts, simulator, engine='aer', seed=None, sweep='per_shot', synthesis='mcry',
+                   encoder='frqi'):
+    # simulate_counts for either encoder; synthesis only applies to FRQI
+    if encoder == 'frqi':
+        return simulate_counts(image_to_angles(image), shot_counts, simulator, engine, seed, sweep, synthesis)
+    elif encoder == 'neqr':
+        return neqr.simulate_counts(image, shot_counts, simulator, engine, seed, sweep)
+    else:
+        raise ValueError(f"Unknown encoder: {encoder}")
+
+def simulate_images(images, shot_counts, simulator, engine='aer', seed=None, sweep='per_shot', synthesis='mcry',
+                    encoder='frqi'):
+    # simulate_counts_batch for either encoder
+    if encoder == 'frqi':
+        angles_batch = np.stack([image_to_angles(image) for image in images])
+        return simulate_counts_batch(angles_batch, shot_counts, simulator, engine, seed, sweep, synthesis)
+    elif encoder == 'neqr':
+        return neqr.simulate_counts_batch(images, shot_counts, simulator, engine, seed, sweep)
+    else:
+        raise ValueError(f"Unknown encoder: {encoder}")
+
+def decode_images(count_grid, shot_counts, encoder='frqi'):
+    if encoder == 'frqi':
+        return decode_counts(count_grid, shot_counts)
+    elif encoder == 'neqr':
+        return neqr.decode_counts(count_grid, shot_counts)
+    else:
+        raise ValueError(f"Unknown encoder: {encoder}")
 
-            rows.append((i, shots, value))
-            metric_sums[j] = value
+def num_outcomes(encoder, num_pixels=64):
+    return neqr.NUM_OUTCOMES if encoder == 'neqr' else 2 * num_pixels
 
+def image_seed(base_seed, index):
+    # independent stream per image; kept well below 2**31 since per-shot runs add j
+    return int(np.random.SeedSequence([base_seed, index]).generate_state(1)[0] % (2 ** 30))
+
+def _cache_variant(encoder, synthesis):
+    # NEQR has one circuit, so its cache entries do not depend on the synthesis mode
+    return synthesis if encoder == 'frqi' else encoder
+
+def metric_values(metric, original, retrieved_imgs):
+    # original (..., side, side) against retrieved (..., shots, side, side) in one NumPy call
+    if metric == 'balanced_mae':
+        return balanced_weighted_mae_batch(original, retrieved_imgs)
+    elif metric == 'mae':
+        return mae_batch(original, retrieved_imgs)
+    elif metric == 'ssim':
+        return SSIM_batch(original, retrieved_imgs)
+    elif metric == 'quantum_state':
+        return quantum_state_fidelity_batch(original, retrieved_imgs)
+    else:
+        raise ValueError(f"Unknown metric: {metric}")
+
+def process_image(i, images, shot_counts, simulator, metric, engine='aer', seed=None, sweep='per_shot',
+                  synthesis='mcry', cache=None, encoder='frqi', image_size=None):
+    # image_size fits the dataset image to a larger power-of-two register (prepare_image);
+    # metrics compare against the fitted image
+    try:
+        image = prepare_image(images[i], image_size)
+        variant = _cache_variant(encoder, synthesis)
+        count_grid = None
+        if cache is not None:
+            count_grid = cache.get(image, shot_counts, engine, sweep, seed, variant, encoder)
+        if count_grid is None:
+            count_grid = simulate_image(image, shot_counts, simulator, engine, seed, sweep, synthesis, encoder)
+            if cache is not None:
+                cache.put(image, shot_counts, count_grid, engine, sweep, seed, variant, encoder)
+        retrieved_imgs = decode_images(count_grid, shot_counts, encoder)
+        metric_sums = metric_values(metric, image, retrieved_imgs)
+        rows = [(i, shots, value) for shots, value in zip(shot_counts, metric_sums)]
         return rows, metric_sums
 
     except Exception as e:
         print(f"Skipping image {i} due to error: {e}")
         return [], np.zeros_like(shot_counts, dtype=float)
 
+def process_image_batch(indices, images, shot_counts, simulator, metric, engine='aer', seed=None,
+                        sweep='per_shot', synthesis='mcry', cache=None, encoder='frqi', image_size=None):
+    # process_image for several images at once; returns one (rows, metric_sums) per index.
+    # One job draws the whole chunk, so an image's counts depend on the other images in it:
+    # cache entries are keyed by the chunk's contents and are only used when all hit.
+    try:
+        originals = prepare_image(images[indices], image_size)
+        variant = _cache_variant(encoder, synthesis)
+        chunk = image_hash(originals)[:16]
+        variants = [f'{variant}/chunk:{chunk}:{b}' for b in range(len(indices))]
+        count_grid = None
+        if cache is not None:
+            cached = [cache.get(originals[b], shot_counts, engine, sweep, seed, variants[b], encoder)
+                      for b in range(len(indices))]
+            if all(c is not None for c in cached):
+                count_grid = np.stack(cached)
+        if count_grid is None:
+            count_grid = simulate_images(originals, shot_counts, simulator, engine, seed, sweep, synthesis, encoder)
+            if cache is not None:
+                for b in range(len(indices)):
+                    cache.put(originals[b], shot_counts, count_grid[b], engine, sweep, seed, variants[b], encoder)
+        retrieved_imgs = decode_images(count_grid, shot_counts, encoder)
+        metric_grid = metric_values(metric, originals, retrieved_imgs)
+    except Exception as e:
+        print(f"Skipping images {indices[0]}-{indices[-1]} due to error: {e}")
+        return [([], np.zeros_like(shot_counts, dtype=float)) for _ in indices]
+
+    results = []
+    for i, metric_sums in zip(indices, metric_grid):
+        rows = [(i, shots, value) for shots, value in zip(shot_counts, metric_sums)]
+        results.append((rows, metric_sums))
+    return results
 
-def run_batch(start, size, simulator, progress, metric):
+
+_process_pool = None
+_process_pool_workers = None
+_process_pool_lock = threading.Lock()
+_worker_simulator = None
+
+def _init_worker():
+    # Each worker process maps the dataset once
+    load_dataset()
+
+def _get_worker_simulator():
+    # One long-lived simulator per worker, created on the first Aer image. Aer is limited
+    # to one thread so the pool, not OpenMP, spreads work over the cores
+    global _worker_simulator
+    if _worker_simulator is None:
+        from qiskit_aer import AerSimulator
+        _worker_simulator = AerSimulator(max_parallel_threads=1)
+    return _worker_simulator
+
+def _process_image_in_worker(i, shot_counts, metric, engine, seed, sweep, synthesis, cache, encoder='frqi',
+                             image_size=None):
+    images, _ = load_dataset()
+    simulator = _get_worker_simulator() if engine == 'aer' else None
+    rows, _ = process_image(i, images, shot_counts, simulator, metric, engine, seed, sweep, synthesis, cache,
+                            encoder, image_size)
+    # only the metric values travel back, the parent rebuilds the rows
+    return np.array([value for _, _, value in rows], dtype=float) if rows else None
+
+def get_process_pool(workers=None):
+    # One shared pool, kept alive between batches so workers keep their simulator and
+    # mapping. workers is capped at the CPU count; asking for another size replaces the
+    # pool, and work already submitted to the old one still finishes.
+    global _process_pool, _process_pool_workers
+    workers = min(workers or os.cpu_count(), os.cpu_count())
+    with _process_pool_lock:
+        if _process_pool is not None and _process_pool_workers != workers:
+            _process_pool.shutdown(wait=False)
+            _process_pool = None
+        if _process_pool is None:
+            _process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+            _process_pool_workers = workers
+        return _process_pool
+
+def discard_process_pool(pool):
+    # A worker that died takes the whole pool down; drop it so the next batch starts fresh
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def run_batch(start, size, simulator, progress, metric, engine='aer', sweep='per_shot', synthesis='mcry',
+              executor='thread', workers=None, images_per_job=20, cache=None, cancel_event=None, prefix=None,
+              on_image=None, encoder='frqi', image_size=None, seed=None):
+    # cancel_event (threading.Event) stops the run between images; a cancelled run
+    # writes no results. on_image(index, shot_counts, values) is called as each image
+    # finishes. image_size runs FRQI on images fitted to a size x size register
+    # (prepare_image). seed gives every image (batched: every chunk) its own seed via
+    # image_seed, so a rerun, e.g. with another metric, draws the same counts and can
+    # be served from the cache; None draws fresh counts and bypasses the cache.
+    # Returns the output filenames and the per-shot statistics.
+    if executor not in ('batched', 'thread', 'process'):
+        raise ValueError(f"Unknown executor: {executor}")
+    if encoder not in ENCODERS:
+        raise ValueError(f"Unknown encoder: {encoder}")
+    if encoder == 'neqr' and image_size not in (None, 8):
+        raise ValueError("NEQR encodes 8x8 images only")
     end = start + size
+    prefix = prefix or f'batch_{start}'
+    cancel_event = cancel_event or threading.Event()
     progress['done'] = 0
     progress['total'] = size
     progress['status'] = 'running'
 
     images, _ = load_and_process_image(0)
+    # fails early on an image size the dataset does not fit
+    prepare_image(images[0], image_size)
     shot_counts = np.arange(100, 2100, 100)
 
     metric_name_map = {
@@ -66,31 +277,92 @@ def run_batch(start, size, simulator, progress, metric):
     }
     metric_name = metric_name_map.get(metric, metric.upper())
 
-    all_rows = [('ImageIndex', 'Shots', metric_name)]
-    avg_metric = np.zeros_like(shot_counts, dtype=float)
+    # rows go to disk as images finish; only the running per-shot stats stay in memory
+    result_prefix = f'{prefix}_results_{metric_name.lower().replace(" ", "_")}'
+    writer = ResultWriter(result_prefix, metric_name)
+    stats = RunningStats(len(shot_counts))
+
+    def record(i, rows, metric_sums):
+        progress['done'] += 1
+        if rows:
+            writer.write_image(i, shot_counts, metric_sums)
+            stats.update(metric_sums)
+            if on_image:
+                on_image(i, shot_counts, metric_sums)
+
+    def seed_for(index):
+        return None if seed is None else image_seed(seed, index)
+
+    pool = None
+    try:
+        if executor == 'batched':
+            # one simulator job per chunk of images, run on this thread
+            for chunk_start in range(start, end, images_per_job):
+                if cancel_event.is_set():
+                    break
+                indices = list(range(chunk_start, min(chunk_start + images_per_job, end)))
+                results = process_image_batch(indices, images, shot_counts, simulator, metric, engine,
+                                              seed_for(chunk_start), sweep, synthesis, cache, encoder, image_size)
+                for i, (rows, metric_sums) in zip(indices, results):
+                    record(i, rows, metric_sums)
+            futures = {}
+        elif executor == 'thread':
+            # threads share the simulator passed in; fine for the analytic engine and small batches
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=min(workers or 4, os.cpu_count()))
+            futures = {
+                pool.submit(process_image, i, images, shot_counts, simulator, metric, engine, seed_for(i), sweep,
+                            synthesis, cache, encoder, image_size): i
+                for i in range(start, end)
+            }
+        elif executor == 'process':
+            pool = get_process_pool(workers)
+            futures = {
+                pool.submit(_process_image_in_worker, i, shot_counts, metric, engine, seed_for(i), sweep,
+                            synthesis, cache, encoder, image_size): i
+                for i in range(start, end)
+            }
 
-    # Use ThreadPoolExecutor instead of ProcessPoolExecutor
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        futures = {
-            executor.submit(process_image, i, images, shot_counts, simulator, metric): i
-            for i in range(start, end)
-        }
         for future in concurrent.futures.as_completed(futures):
+            if cancel_event.is_set():
+                for pending in futures:
+                    pending.cancel()
+                break
+            i = futures[future]
             try:
-                rows, metric_sums = future.result()
+                result = future.result()
+            except concurrent.futures.process.BrokenProcessPool as e:
+                print(f"Error processing image {i}: {e}")
+                discard_process_pool(pool)
+                continue
             except Exception as e:
-                print(f"Error processing image {futures[future]}: {e}")
+                print(f"Error processing image {i}: {e}")
                 continue
-            all_rows.extend(rows)
-            avg_metric += metric_sums
-            progress['done'] += 1
+            if executor == 'process':
+                if result is None:
+                    rows, metric_sums = [], np.zeros_like(shot_counts, dtype=float)
+                else:
+                    rows = [(i, shots, value) for shots, value in zip(shot_counts, result)]
+                    metric_sums = result
+            else:
+                rows, metric_sums = result
+            record(i, rows, metric_sums)
+    except BaseException:
+        writer.discard()
+        raise
+    finally:
+        if executor == 'thread' and pool is not None:
+            pool.shutdown()
 
-    avg_metric /= size
+    if cancel_event.is_set():
+        writer.discard()
+        progress['status'] = 'cancelled'
+        return None
+    writer.close()
 
-    filename = f'batch_{start}_results_{metric_name.lower().replace(" ", "_")}.csv'
-    with open(filename, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerows(all_rows)
+    from website.plot import plot_metrics
 
-    plot_metrics(shot_counts, avg_metric, metric_name, prefix=f'batch_{start}')
+    # mean and std over the images that were processed; skipped images are left out
+    plot_filename = plot_metrics(shot_counts, stats.mean, metric_name, std_metric=stats.std(), prefix=prefix,
+                                 title=f'{encoder.upper()}: Shots vs Average Fidelity')
     progress['status'] = 'done'
+    return {'csv': writer.csv_path, 'npy': writer.part_paths(), 'plot': plot_filename, 'stats': stats.to_dict()}
@@ -0,0 +1,136 @@
+import collections
+import itertools
+import queue
+import threading
+import time
+from website.results import RunningStats
+from website.simulate import get_simulator
+
+
+# finished-image events kept per job for clients reconnecting with Last-Event-ID
+REPLAY_EVENTS = 64
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, params):
+        self.id = job_id
+        self.params = params
+        self.progress = {'done': 0, 'total': params['size'], 'status': 'queued'}
+        self.cancel_event = threading.Event()
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        # (event id, event) for the last REPLAY_EVENTS finished images, each with the running
+        # per-shot mean/std up to that image; num_events counts all of them
+        self.events = collections.deque(maxlen=REPLAY_EVENTS)
+        self.num_events = 0
+        self._stats = None
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.progress['status'] in ('done', 'cancelled', 'failed')
+
+    def to_dict(self):
+        return {'job': self.id, 'error': self.error, **self.params, **self.progress}
+
+    def record_image(self, index, shot_counts, values):
+        with self._changed:
+            if self._stats is None:
+                self._stats = RunningStats(len(shot_counts))
+            self._stats.update(values)
+            self.events.append((self.num_events, {'image': int(index), 'shots': [int(s) for s in shot_counts],
+                                'values': [float(v) for v in values], 'images': self._stats.count,
+                                'mean': self._stats.mean.tolist(), 'std': self._stats.std().tolist(),
+                                'min': self._stats.min.tolist(), 'max': self._stats.max.tolist()}))
+            self.num_events += 1
+            self._changed.notify_all()
+
+    def notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def wait_events(self, since, timeout=None):
+        # (event id, event) pairs with ids from `since` on, blocking until there is one or the
+        # job finishes; a client further behind gets the oldest events still buffered
+        with self._changed:
+            self._changed.wait_for(lambda: self.num_events > since or self.finished, timeout)
+            return [(event_id, event) for event_id, event in self.events if event_id >= since]
+
+
+class JobScheduler:
+    # Batch jobs wait in one queue and a fixed number of runner threads execute them, so
+    # concurrent users share a bounded amount of CPU instead of each starting their own pool.
+    # Submissions beyond max_queued waiting jobs are refused (QueueFull).
+
+    def __init__(self, simulator=None, cache=None, max_running=2, max_queued=8, keep_finished=100):
+        self.simulator = simulator
+        self.cache = cache
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._runners = []
+
+    def submit(self, **params):
+        with self._lock:
+            waiting = sum(1 for job in self._jobs.values() if job.progress['status'] == 'queued')
+            if waiting >= self.max_queued:
+                raise QueueFull(f"{waiting} jobs already waiting")
+            job = Job(str(next(self._ids)), params)
+            self._jobs[job.id] = job
+            self._forget_old_jobs()
+            if len(self._runners) < self.max_running:
+                runner = threading.Thread(target=self._run_forever, daemon=True)
+                runner.start()
+                self._runners.append(runner)
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(str(job_id))
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        if job.progress['status'] == 'queued':
+            job.progress['status'] = 'cancelled'
+            job.notify()
+        return job
+
+    def _forget_old_jobs(self):
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.created)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
+
+    def _run_forever(self):
+        while True:
+            job = self._queue.get()
+            if job.cancel_event.is_set():
+                job.progress['status'] = 'cancelled'
+                continue
+            try:
+                from website.logic.batch_processing import run_batch
+
+                job.result = run_batch(simulator=self.simulator or get_simulator(), progress=job.progress, cache=self.cache,
+                                       cancel_event=job.cancel_event, prefix=f'job_{job.id}',
+                                       on_image=job.record_image, **job.params)
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.progress['status'] = 'failed'
+            job.notify()
@@ -0,0 +1,167 @@
+import numpy as np
+from website.analytic import nested_counts_from_outcomes, sample_from_probabilities, sample_nested, segment_counts
+from website.decode import counts_to_array, outcomes_to_counts
+from website.simulate import get_simulator, outcome_probabilities, outcome_stream
+
+# NEQR (novel enhanced quantum representation) for 8x8 greyscale images: 6 position
+# qubits in uniform superposition, and 8 intensity qubits holding each pixel's value
+# exactly. Qubits 0-5 are the position (bit k of the index on qubit k) and 6-13 the
+# intensity, so the Aer outcome integer is 64 * intensity + position.
+#
+# Same interface as the FRQI path: build_circuit, simulate_counts(_batch) on (shots, 16384)
+# histograms and decode_counts (decode_outcomes for raw outcome streams). The circuit
+# depends on the pixel bits, not on angles, so there is no parameterized template; it is
+# rebuilt per image, which is cheap.
+
+NUM_POSITIONS = 64
+NUM_OUTCOMES = 64 * 256
+
+def _pixels(images):
+    # (..., 8, 8) -> (..., 64) int64 pixel values
+    images = np.asarray(images)
+    if images.shape[-2:] != (8, 8):
+        raise ValueError(f"NEQR encodes 8x8 images only, got {images.shape[-2:]}")
+    return images.astype(np.int64).reshape(images.shape[:-2] + (NUM_POSITIONS,))
+
+def build_circuit(image):
+    from qiskit import QuantumRegister, ClassicalRegister, QuantumCircuit
+
+    pixels = _pixels(image)
+    position = QuantumRegister(6, 'pos')
+    intensity = QuantumRegister(8, 'int')
+    cr = ClassicalRegister(14, 'c')
+    qc = QuantumCircuit(position, intensity, cr)
+    qc.h(position)
+    for idx, value in enumerate(pixels):
+        # flip the position qubits whose index bit is 0, so the MCX gates fire on |idx>
+        flips = [position[k] for k in range(6) if not (idx >> k) & 1]
+        if flips:
+            qc.x(flips)
+        for k in range(8):
+            if (int(value) >> k) & 1:
+                qc.mcx(list(position), intensity[k])
+        if flips:
+            qc.x(flips)
+    qc.measure(list(position) + list(intensity), cr)
+    return qc
+
+# h, x and mcx are native Aer instructions, so the circuit is run without transpiling
+
+def positions_to_outcomes(images, position_counts):
+    # position histograms (..., [S,] 64) -> outcome histograms (..., [S,] 16384); every
+    # shot on a position reads that pixel's intensity
+    pixels = _pixels(images)
+    position_counts = np.asarray(position_counts, dtype=np.int64)
+    if position_counts.ndim > pixels.ndim:
+        pixels = pixels[..., None, :]
+    pixels = np.broadcast_to(pixels, position_counts.shape)
+    counts = np.zeros(position_counts.shape[:-1] + (NUM_OUTCOMES,), dtype=np.int64)
+    np.put_along_axis(counts, pixels * NUM_POSITIONS + np.arange(NUM_POSITIONS), position_counts, axis=-1)
+    return counts
+
+def sample_counts(images, shots, rng=None, nested=False):
+    # Ideal NEQR sampling: the state is uniform over positions with a deterministic
+    # intensity, so only the positions are drawn (a 64-way multinomial per grid point)
+    lead = np.shape(images)[:-2]
+    uniform = np.full(lead + (NUM_POSITIONS,), 1.0 / NUM_POSITIONS)
+    if nested:
+        position_counts = sample_nested(uniform, shots, rng=rng)
+    else:
+        position_counts = sample_from_probabilities(uniform, shots, rng=rng)
+    return positions_to_outcomes(images, position_counts)
+
+def batched_outcome_streams(images, shots, simulator=None, seed=None):
+    # One Aer job for a batch of images: (images, shots) outcome integers
+    simulator = simulator or get_simulator()
+    circuits = [build_circuit(image) for image in images]
+    result = simulator.run(circuits, shots=shots, memory=True, seed_simulator=seed,
+                           max_parallel_experiments=0).result()
+    return np.array([[int(m, 16) for m in result.data(k)['memory']] for k in range(len(circuits))],
+                    dtype=np.int64)
+
+def batched_probabilities(images, simulator=None):
+    # Exact outcome distributions (images, 16384) in one Aer job
+    simulator = simulator or get_simulator()
+    circuits = []
+    for image in images:
+        qc = build_circuit(image).remove_final_measurements(inplace=False)
+        qc.save_probabilities()
+        circuits.append(qc)
+    result = simulator.run(circuits, shots=1, max_parallel_experiments=0).result()
+    probs = np.clip(np.array([result.data(k)['probabilities'] for k in range(len(circuits))], dtype=float), 0.0, None)
+    return probs / probs.sum(axis=1, keepdims=True)
+
+def simulate_counts(image, shot_counts, simulator, engine='aer', seed=None, sweep='per_shot'):
+    # Outcome histograms for every shot count of one image, shape (len(shot_counts), 16384)
+    if engine == 'aer':
+        qc = build_circuit(image)
+        if sweep == 'per_shot':
+            count_grid = np.zeros((len(shot_counts), NUM_OUTCOMES), dtype=np.int64)
+            for j, shots in enumerate(shot_counts):
+                seed_j = None if seed is None else seed + j
+                result = simulator.run(qc, shots=int(shots), seed_simulator=seed_j).result()
+                count_grid[j] = counts_to_array(result.data()['counts'], NUM_OUTCOMES)
+        elif sweep == 'distribution':
+            probs = outcome_probabilities(qc, simulator)
+            count_grid = sample_from_probabilities(probs, shot_counts, rng=seed)
+        elif sweep == 'nested':
+            outcomes = outcome_stream(qc, int(np.max(shot_counts)), simulator, seed=seed)
+            count_grid = nested_counts_from_outcomes(outcomes, shot_counts, NUM_OUTCOMES)
+        else:
+            raise ValueError(f"Unknown sweep mode: {sweep}")
+    elif engine == 'analytic':
+        if sweep not in ('per_shot', 'distribution', 'nested'):
+            raise ValueError(f"Unknown sweep mode: {sweep}")
+        count_grid = sample_counts(image, shot_counts, rng=seed, nested=sweep == 'nested')
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+    return count_grid
+
+def simulate_counts_batch(images, shot_counts, simulator, engine='aer', seed=None, sweep='per_shot'):
+    # Same as simulate_counts for a batch of images, shape (images, len(shot_counts), 16384)
+    images = np.asarray(images)
+    if engine == 'aer':
+        if sweep == 'per_shot':
+            outcomes = batched_outcome_streams(images, int(np.sum(shot_counts)), simulator, seed)
+            return segment_counts(outcomes, shot_counts, NUM_OUTCOMES)
+        elif sweep == 'distribution':
+            return sample_from_probabilities(batched_probabilities(images, simulator), shot_counts, rng=seed)
+        elif sweep == 'nested':
+            outcomes = batched_outcome_streams(images, int(np.max(shot_counts)), simulator, seed)
+            return nested_counts_from_outcomes(outcomes, shot_counts, NUM_OUTCOMES)
+        else:
+            raise ValueError(f"Unknown sweep mode: {sweep}")
+    elif engine == 'analytic':
+        if sweep not in ('per_shot', 'distribution', 'nested'):
+            raise ValueError(f"Unknown sweep mode: {sweep}")
+        return sample_counts(images, shot_counts, rng=seed, nested=sweep == 'nested')
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+def vote_matrix(counts):
+    # outcome histograms (..., 16384) -> votes (..., 64, 256): how often each position
+    # was read with each intensity. A histogram is the flattened (intensity, position)
+    # table, so this is a reshape, not a copy.
+    counts = np.asarray(counts)
+    return counts.reshape(counts.shape[:-1] + (256, NUM_POSITIONS)).swapaxes(-1, -2)
+
+def outcomes_to_votes(outcomes):
+    # outcome integers (..., shots), e.g. an Aer memory stream -> votes (..., 64, 256)
+    return vote_matrix(outcomes_to_counts(outcomes, NUM_OUTCOMES))
+
+def decode_votes(votes):
+    # votes (..., 64, 256) -> images (..., 8, 8). Winner takes all along the intensity
+    # axis; ties go to the lowest intensity, and a position that was never measured
+    # (all zero votes) decodes to 0.
+    votes = np.asarray(votes)
+    return votes.argmax(axis=-1).reshape(votes.shape[:-2] + (8, 8))
+
+def decode_counts(counts, shots=None):
+    # counts (..., 16384) -> reconstructed images (..., 8, 8), e.g. a whole
+    # (images, shot grid, 16384) tensor at once. shots is unused and only kept for the
+    # FRQI signature.
+    return decode_votes(vote_matrix(counts))
+
+def decode_outcomes(outcomes):
+    # outcome integers (..., shots) -> reconstructed images (..., 8, 8)
+    return decode_votes(outcomes_to_votes(outcomes))
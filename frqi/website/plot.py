@@ -26,7 +26,8 @@ def plot_trendline(ax, x, y, yerr=None):
         mask = x > 0
         x, y = x[mask], y[mask]
         if yerr is not None:
-            yerr = yerr[mask]
+            # a zero spread (e.g. NEQR once every image is exact) would get infinite weight
+            yerr = np.maximum(yerr[mask], 1e-3)
 
         if x.size == 0:
             print("No valid shot counts to fit.")
@@ -100,4 +101,5 @@ def plot_metrics(shot_counts, avg_metric, metric_name, std_metric=None, prefix='
     ax.legend(by_label.values(), by_label.keys())
     plot_filename = f'{prefix}_plot_ssim.png' if metric_name.lower() == 'ssim' else f'{prefix}_plot_mae.png'
     plt.savefig(os.path.join(os.getcwd(), plot_filename), format='png')
-    plt.close(fig)
\ No newline at end of file
+    plt.close(fig)
+    return plot_filename
\ No newline at end of file
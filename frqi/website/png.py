@@ -0,0 +1,56 @@
+import base64
+import collections
+import hashlib
+import struct
+import threading
+import zlib
+import numpy as np
+
+# Minimal greyscale PNG writer for the small images the pages show. Images are
+# upscaled by pixel repetition, so an 8x8 image stays crisp without any resampling.
+
+DEFAULT_SCALE = 16
+MAX_CACHED = 4096
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+def encode_png(image, scale=DEFAULT_SCALE):
+    # (H, W) values in 0..255 -> 8-bit greyscale PNG bytes
+    pixels = np.clip(np.asarray(image, dtype=float), 0, 255).astype(np.uint8)
+    pixels = np.repeat(np.repeat(pixels, scale, axis=0), scale, axis=1)
+    height, width = pixels.shape
+    # every scanline starts with filter type 0 (none)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels]).tobytes()
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _chunk(b'IHDR', header) + _chunk(b'IDAT', zlib.compress(raw, 6))
+            + _chunk(b'IEND', b''))
+
+def png_key(image, scale=DEFAULT_SCALE):
+    pixels = np.clip(np.asarray(image, dtype=float), 0, 255).astype(np.uint8)
+    digest = hashlib.sha1(f'{pixels.shape}:{scale}'.encode())
+    digest.update(pixels.tobytes())
+    return digest.hexdigest()[:20]
+
+def render_png(image, scale=DEFAULT_SCALE):
+    # Encodes through the LRU; returns (key, png bytes). The key only depends on the
+    # pixels and scale, so it doubles as the HTTP ETag.
+    key = png_key(image, scale)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return key, _cache[key]
+    data = encode_png(image, scale)
+    with _cache_lock:
+        _cache[key] = data
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+    return key, data
+
+def png_data_uri(image, scale=DEFAULT_SCALE):
+    # for one-off images that no URL can recompute
+    _, data = render_png(image, scale)
+    return 'data:image/png;base64,' + base64.b64encode(data).decode('ascii')
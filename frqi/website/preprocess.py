@@ -1,13 +1,89 @@
-
-import pandas as pd
 import numpy as np
 import os
+import threading
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+DATASET_PATH = os.path.join(STATIC_DIR, 'mnist_dataset.csv')
+IMAGES_PATH = os.path.join(STATIC_DIR, 'mnist_images.npy')
+LABELS_PATH = os.path.join(STATIC_DIR, 'mnist_labels.npy')
+
+_store = None
+_store_lock = threading.Lock()
+
+def convert_dataset(csv_path=DATASET_PATH, images_path=IMAGES_PATH, labels_path=LABELS_PATH):
+    # One-time conversion of the CSV (label + side*side pixel columns, e.g. 64 for the
+    # 8x8 set or 784 for full-size MNIST) into uint8 .npy files
+    import pandas as pd
+    data = pd.read_csv(csv_path).to_numpy()
+    labels = data[:, 0].astype(np.uint8)
+    side = int(np.sqrt(data.shape[1] - 1))
+    if side * side != data.shape[1] - 1:
+        raise ValueError(f"{csv_path}: {data.shape[1] - 1} pixel columns do not form a square image")
+    images = np.clip(data[:, 1:], 0, 255).astype(np.uint8).reshape(-1, side, side)
+    # write under a temporary name first so concurrent readers never see a partial file
+    for path, arr in ((labels_path, labels), (images_path, images)):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp_path, path)
+    return images_path, labels_path
+
+def _store_is_stale():
+    if not (os.path.exists(IMAGES_PATH) and os.path.exists(LABELS_PATH)):
+        return True
+    if os.path.exists(DATASET_PATH):
+        return os.path.getmtime(DATASET_PATH) > os.path.getmtime(IMAGES_PATH)
+    return False
+
+def load_dataset():
+    # Read-only memory map shared by every route, thread and worker process
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if _store_is_stale():
+                    convert_dataset()
+                images = np.load(IMAGES_PATH, mmap_mode='r')
+                labels = np.load(LABELS_PATH, mmap_mode='r')
+                _store = (images, labels)
+    return _store
+
+def dataset_size():
+    images, _ = load_dataset()
+    return images.shape[0]
+
+def get_image(index):
+    images, _ = load_dataset()
+    return np.asarray(images[index])
+
+def get_label(index):
+    _, labels = load_dataset()
+    return int(labels[index])
+
+def prepare_image(image, size=None):
+    # Fit a dataset image to a size x size FRQI register (size a power of two): a
+    # smaller image whose side divides size is upsampled by pixel repetition, any other
+    # smaller image is zero-padded around the centre (28x28 MNIST -> 32x32).
+    image = np.asarray(image)
+    side = image.shape[-1]
+    if size is None or size == side:
+        return image
+    if size & (size - 1) or size < 4:
+        raise ValueError(f"Image size must be a power of two of at least 4, got {size}")
+    if side > size:
+        raise ValueError(f"Cannot fit a {side}x{side} image into {size}x{size}")
+    if size % side == 0:
+        factor = size // side
+        return image.repeat(factor, axis=-2).repeat(factor, axis=-1)
+    before = (size - side) // 2
+    pad = [(0, 0)] * (image.ndim - 2) + [(before, size - side - before)] * 2
+    return np.pad(image, pad)
+
+def image_to_angles(image):
+    normalized_pixels = np.asarray(image, dtype=float).reshape(-1) / 255.0
+    return np.arcsin(normalized_pixels)
 
-def load_and_process_image(selected_index):
-    dataset_path = os.path.join(os.path.dirname(__file__), 'static', 'mnist_dataset.csv')
-    dataset = pd.read_csv(dataset_path)
-    images = dataset.to_numpy()[:, 1:].reshape(42000, 8, 8)
-    pixel_values = images.reshape(42000, 64)
-    normalized_pixels = pixel_values / 255.0
-    angles = np.arcsin(normalized_pixels[selected_index, :])
-    return images, angles
\ No newline at end of file
+def load_and_process_image(selected_index, size=None):
+    images, _ = load_dataset()
+    angles = image_to_angles(prepare_image(images[selected_index], size))
+    return images, angles
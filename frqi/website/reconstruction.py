@@ -0,0 +1,136 @@
+import collections
+import threading
+import time
+import numpy as np
+from website.analysis import SSIM, balanced_weighted_mae, mae, quantum_state_fidelity
+from website import neqr
+from website.build_circuit import bind_circuit, circuit_template
+from website.decode import counts_to_array, decode_counts
+from website.preprocess import get_image, image_to_angles, prepare_image
+from website.simulate import ENCODERS
+
+# Single-image reconstructions for the interactive pages (/inspect_image and the demo).
+# Seeded results are memoized in-process for a few minutes, so flipping between the same
+# (image, shots, seed) combinations does not simulate, decode or score again; without a
+# seed every call is a fresh draw.
+
+METRICS = {
+    'balanced_mae': balanced_weighted_mae,
+    'mae': mae,
+    'ssim': SSIM,
+    'quantum_state': quantum_state_fidelity,
+}
+
+DEFAULT_TTL = 600
+# every reconstruction is a full simulation, so the pages cap the shots (the demo slider's range)
+MAX_SHOTS = 5000
+# seed the pages use unless the form sets one, so revisiting a combination hits the memo
+DEFAULT_SEED = 0
+DEFAULT_MAX_ENTRIES = 512
+
+class ReconstructionCache:
+    # LRU of reconstructions whose entries also expire ttl seconds after being computed
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                    'hit_rate': self.hits / total if total else 0.0}
+
+reconstructions = ReconstructionCache()
+
+def encoding_error(encoder, image_size=None):
+    # -> why images cannot be encoded with (encoder, image_size), or None; routes turn
+    # this into a 400 instead of failing inside the reconstruction
+    if encoder not in ENCODERS:
+        return f"Unknown encoder: {encoder}"
+    if encoder == 'neqr' and image_size not in (None, 8):
+        return "NEQR encodes 8x8 images only"
+    try:
+        prepare_image(get_image(0), image_size)
+    except ValueError as e:
+        return str(e)
+    return None
+
+def _simulate_counts(image, shots, seed, simulator, result_cache, encoder):
+    variant = 'mcry' if encoder == 'frqi' else encoder
+    count_grid = result_cache.get(image, [shots], 'aer', 'per_shot', seed, variant, encoder) if result_cache else None
+    if count_grid is None:
+        if encoder == 'frqi':
+            template = circuit_template(simulator, optimization_level=None, num_pixels=image.size)
+            t_qc = bind_circuit(template, image_to_angles(image))
+        else:
+            t_qc = neqr.build_circuit(image)
+        options = {} if seed is None else {'seed_simulator': seed}
+        result = simulator.run(t_qc, shots=shots, **options).result()
+        num_outcomes = neqr.NUM_OUTCOMES if encoder == 'neqr' else 2 * image.size
+        count_grid = counts_to_array(result.data()['counts'], num_outcomes)[None]
+        if result_cache:
+            result_cache.put(image, [shots], count_grid, 'aer', 'per_shot', seed, variant, encoder)
+    return count_grid[0]
+
+def reconstruct(index, shots, simulator, seed=None, metric='all', result_cache=None, cache=reconstructions,
+                encoder='frqi', image_size=None):
+    # -> {'original', 'retrieved', 'diff', 'metrics'}; metric is a METRICS name or 'all'.
+    # A metric that fails is reported as 'N/A'.
+    if metric != 'all' and metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+    if encoder not in ENCODERS:
+        raise ValueError(f"Unknown encoder: {encoder}")
+    key = (index, shots, seed, metric, encoder, image_size)
+    found = None if seed is None else cache.get(key)
+    if found is not None:
+        return found
+
+    original = prepare_image(get_image(index), image_size)
+    counts = _simulate_counts(original, shots, seed, simulator, result_cache, encoder)
+    decode = decode_counts if encoder == 'frqi' else neqr.decode_counts
+    retrieved = decode(counts, shots)
+    names = list(METRICS) if metric == 'all' else [metric]
+    metrics = {}
+    for name in names:
+        try:
+            metrics[name] = METRICS[name](original, retrieved)
+        except Exception as e:
+            print(f"{name} error: {e}")
+            metrics[name] = 'N/A'
+    value = {
+        'original': original,
+        'retrieved': retrieved,
+        'diff': np.abs(original.astype(float) - retrieved.astype(float)),
+        'metrics': metrics,
+    }
+    if seed is not None:
+        cache.put(key, value)
+    return value
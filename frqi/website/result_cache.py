@@ -0,0 +1,154 @@
+import contextlib
+import hashlib
+import os
+import sqlite3
+import time
+import numpy as np
+
+# Persistent store of raw outcome counts, so re-analysing the same images and shot grids
+# (another metric, the inspect page, the demo) does not re-simulate anything. Metrics are
+# always computed from the cached counts.
+
+DEFAULT_CACHE_PATH = os.path.join(os.getcwd(), 'frqi_result_cache.sqlite')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Bump an encoder's version whenever its circuit or decoding changes; entries written
+# under an older version are never returned and are dropped by purge_stale().
+ENCODER_VERSIONS = {'frqi': 1, 'neqr': 1}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS counts (
+    image_hash TEXT NOT NULL,
+    encoder TEXT NOT NULL,
+    encoder_version INTEGER NOT NULL,
+    variant TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    sweep TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    shots INTEGER NOT NULL,
+    counts BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (image_hash, encoder, encoder_version, variant, engine, sweep, seed, shots)
+);
+CREATE INDEX IF NOT EXISTS counts_last_used ON counts (last_used);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta SELECT 'bytes', COALESCE(SUM(LENGTH(counts)), 0) FROM counts;
+CREATE TRIGGER IF NOT EXISTS counts_insert AFTER INSERT ON counts BEGIN
+    UPDATE meta SET value = value + LENGTH(NEW.counts) WHERE name = 'bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS counts_delete AFTER DELETE ON counts BEGIN
+    UPDATE meta SET value = value - LENGTH(OLD.counts) WHERE name = 'bytes';
+END;
+'''
+
+def image_hash(image):
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    digest = hashlib.sha256(str(image.shape).encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def _sweep_key(sweep, shot_counts):
+    # The counts at one grid point depend on the whole grid (per-shot runs seed grid point
+    # j with seed + j, the analytic engine draws the grid at once, nested points are
+    # prefixes of one stream), so entries are only reusable for the same grid
+    grid = np.asarray(shot_counts, dtype=np.int64)
+    return f'{sweep}:' + hashlib.sha1(grid.tobytes()).hexdigest()[:16]
+
+class ResultCache:
+    # Opens a short-lived SQLite connection per call, so one instance can be shared by
+    # threads and pickled into worker processes. The stored byte total is kept in the meta
+    # table by triggers, in the same transaction as the write, so eviction never scans the
+    # whole table. Unseeded runs are not cached: their counts are meant to be a fresh draw.
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # rows dropped by INSERT OR REPLACE only fire the delete trigger with this on
+        conn.execute('PRAGMA recursive_triggers=ON')
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _key(self, image, encoder, variant, engine, sweep, seed, shot_counts):
+        return (image_hash(image), encoder, ENCODER_VERSIONS[encoder], variant, engine,
+                _sweep_key(sweep, shot_counts), int(seed))
+
+    def get(self, image, shot_counts, engine, sweep, seed=None, variant='mcry', encoder='frqi'):
+        # (len(shot_counts), outcomes) counts, or None unless every grid point is cached
+        if seed is None:
+            return None
+        key = self._key(image, encoder, variant, engine, sweep, seed, shot_counts)
+        wanted = [int(s) for s in shot_counts]
+        unique = tuple(sorted(set(wanted)))
+        where = ('image_hash=? AND encoder=? AND encoder_version=? AND variant=? AND engine=? AND sweep=? '
+                 f'AND seed=? AND shots IN ({",".join("?" * len(unique))})')
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT shots, counts FROM counts WHERE {where}', key + unique).fetchall()
+            if len(rows) < len(unique):
+                return None
+            conn.execute(f'UPDATE counts SET last_used=? WHERE {where}', (time.time(),) + key + unique)
+        found = {shots: np.frombuffer(blob, dtype=np.int32) for shots, blob in rows}
+        return np.stack([found[s] for s in wanted]).astype(np.int64)
+
+    def put(self, image, shot_counts, counts, engine, sweep, seed=None, variant='mcry', encoder='frqi'):
+        if seed is None:
+            return
+        key = self._key(image, encoder, variant, engine, sweep, seed, shot_counts)
+        now = time.time()
+        rows = [key + (int(shots), np.asarray(c, dtype=np.int32).tobytes(), now)
+                for shots, c in zip(shot_counts, counts)]
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO counts VALUES (?,?,?,?,?,?,?,?,?,?)', rows)
+        self.evict()
+
+    def size_bytes(self):
+        with self._connect() as conn:
+            return self._total(conn)
+
+    @staticmethod
+    def _total(conn):
+        return conn.execute("SELECT value FROM meta WHERE name='bytes'").fetchone()[0]
+
+    def evict(self, batch=64):
+        # drop least recently used entries until the stored counts fit in max_bytes,
+        # walking the last_used index a few rows at a time
+        removed = 0
+        with self._connect() as conn:
+            total = self._total(conn)
+            while total > self.max_bytes:
+                lru = conn.execute('SELECT rowid, LENGTH(counts) FROM counts ORDER BY last_used LIMIT ?',
+                                   (batch,)).fetchall()
+                if not lru:
+                    break
+                for rowid, size in lru:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute('DELETE FROM counts WHERE rowid=?', (rowid,))
+                    total -= size
+                    removed += 1
+        return removed
+
+    def invalidate(self, encoder=None):
+        # drop every entry, or every entry for one encoder
+        with self._connect() as conn:
+            if encoder is None:
+                return conn.execute('DELETE FROM counts').rowcount
+            return conn.execute('DELETE FROM counts WHERE encoder=?', (encoder,)).rowcount
+
+    def purge_stale(self):
+        # drop entries written under an older encoder version
+        removed = 0
+        with self._connect() as conn:
+            for encoder, version in ENCODER_VERSIONS.items():
+                removed += conn.execute('DELETE FROM counts WHERE encoder=? AND encoder_version<>?',
+                                        (encoder, version)).rowcount
+        return removed
@@ -0,0 +1,159 @@
+import csv
+import glob
+import os
+import numpy as np
+
+# Streaming storage for sweep results. Rows (image, shots, value) go straight to a CSV
+# and to numbered .npy parts, and per-shot statistics are kept with Welford/Chan
+# updates, so memory stays constant however many images a sweep covers.
+
+ROW_DTYPE = np.dtype([('image', np.int64), ('shots', np.int64), ('value', np.float64)])
+
+class RunningStats:
+    # Per-shot-count count/mean/M2/min/max. merge() combines two instances exactly
+    # (Chan et al.), so shards, workers or checkpoints can be summarised separately.
+
+    def __init__(self, size):
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+
+    def update(self, values):
+        # values (shots,) for one image
+        self.update_batch(np.asarray(values, dtype=float)[None])
+
+    def update_batch(self, values):
+        # values (images, shots)
+        values = np.asarray(values, dtype=float)
+        if values.shape[0] == 0:
+            return
+        batch = RunningStats(values.shape[1])
+        batch.count = values.shape[0]
+        batch.mean = values.mean(axis=0)
+        batch.m2 = ((values - batch.mean) ** 2).sum(axis=0)
+        batch.min = values.min(axis=0)
+        batch.max = values.max(axis=0)
+        self.merge(batch)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / n
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / n
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.count = n
+        return self
+
+    def variance(self, ddof=0):
+        if self.count - ddof <= 0:
+            return np.full_like(self.mean, np.nan)
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof=0):
+        return np.sqrt(self.variance(ddof))
+
+    def to_dict(self):
+        # JSON-friendly; min/max are None until the first update
+        finite = self.count > 0
+        return {'count': self.count, 'mean': self.mean.tolist(), 'm2': self.m2.tolist(),
+                'min': self.min.tolist() if finite else None, 'max': self.max.tolist() if finite else None}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(len(data['mean']))
+        stats.count = data['count']
+        stats.mean = np.array(data['mean'], dtype=float)
+        stats.m2 = np.array(data['m2'], dtype=float)
+        if data['min'] is not None:
+            stats.min = np.array(data['min'], dtype=float)
+            stats.max = np.array(data['max'], dtype=float)
+        return stats
+
+def write_summary(path, shot_counts, stats):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('Shots', 'Images', 'Mean', 'Std', 'Variance', 'Min', 'Max'))
+        writer.writerows((int(s), stats.count, float(m), float(sd), float(v), float(lo), float(hi))
+                         for s, m, sd, v, lo, hi in zip(shot_counts, stats.mean, stats.std(), stats.variance(),
+                                                        stats.min, stats.max))
+
+class ResultWriter:
+    # Appends rows to <prefix>.csv and, every chunk_rows rows (or on flush), to
+    # <prefix>_partNNNNN.npy with ROW_DTYPE. state()/resume() let a checkpointed run
+    # drop anything written after its last checkpoint.
+
+    def __init__(self, prefix, metric_name, chunk_rows=65536, resume=None):
+        self.prefix = prefix
+        self.csv_path = prefix + '.csv'
+        self.chunk_rows = chunk_rows
+        self._buffer = np.empty(chunk_rows, dtype=ROW_DTYPE)
+        self._buffered = 0
+        if resume is None:
+            for part in self.part_paths():
+                os.remove(part)
+            self.parts = 0
+            self._csv = open(self.csv_path, 'w', newline='')
+            csv.writer(self._csv).writerow(('ImageIndex', 'Shots', metric_name))
+        else:
+            self.parts = resume['parts']
+            for part in self.part_paths()[self.parts:]:
+                os.remove(part)
+            os.truncate(self.csv_path, resume['csv_bytes'])
+            self._csv = open(self.csv_path, 'a', newline='')
+        self._writer = csv.writer(self._csv)
+
+    def part_paths(self):
+        return sorted(glob.glob(glob.escape(self.prefix) + '_part[0-9][0-9][0-9][0-9][0-9].npy'))
+
+    def write_image(self, index, shot_counts, values):
+        self._writer.writerows((int(index), int(s), float(v)) for s, v in zip(shot_counts, values))
+        for s, v in zip(shot_counts, values):
+            self._buffer[self._buffered] = (index, s, v)
+            self._buffered += 1
+            if self._buffered == self.chunk_rows:
+                self._flush_part()
+
+    def _flush_part(self):
+        if self._buffered:
+            np.save(f'{self.prefix}_part{self.parts:05d}.npy', self._buffer[:self._buffered])
+            self.parts += 1
+            self._buffered = 0
+
+    def flush(self, sync=False):
+        self._flush_part()
+        self._csv.flush()
+        if sync:
+            os.fsync(self._csv.fileno())
+
+    def state(self):
+        self.flush(sync=True)
+        return {'csv_bytes': os.path.getsize(self.csv_path), 'parts': self.parts}
+
+    def close(self):
+        if not self._csv.closed:
+            self.flush()
+            self._csv.close()
+
+    def discard(self):
+        # close and delete everything written, e.g. for a cancelled run
+        self._csv.close()
+        for path in [self.csv_path] + self.part_paths():
+            os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def load_rows(prefix):
+    # all .npy parts of a ResultWriter as one ROW_DTYPE array
+    parts = sorted(glob.glob(glob.escape(prefix) + '_part[0-9][0-9][0-9][0-9][0-9].npy'))
+    if not parts:
+        return np.empty(0, dtype=ROW_DTYPE)
+    return np.concatenate([np.load(p) for p in parts])
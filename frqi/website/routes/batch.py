@@ -1,48 +1,144 @@
-from flask import Blueprint, request, render_template_string, jsonify, current_app, send_file
-import threading
+from flask import Blueprint, request, render_template_string, jsonify, current_app, send_file, Response, stream_with_context
+import json
 import os
 import base64
-from website.logic.batch_processing import run_batch
+from website.logic.jobs import QueueFull
+from website.preprocess import dataset_size
+from website.reconstruction import DEFAULT_SEED, MAX_SHOTS, encoding_error
+from website.simulate import ENGINES, SWEEP_MODES
+from website.build_circuit import SYNTHESIS_MODES
 
 batch_bp = Blueprint('batch', __name__)
 
+def _job_or_404():
+    job = current_app.scheduler.get(request.args.get('job', ''))
+    if job is None:
+        return None, (jsonify({'error': f"Unknown job: {request.args.get('job')}"}), 404)
+    return job, None
+
 @batch_bp.route('/start_batch')
 def start_batch():
-    start = int(request.args.get('start', 0))
-    size = int(request.args.get('size', 20))
+    start = request.args.get('start', 0, type=int)
+    size = request.args.get('size', 20, type=int)
     metric = request.args.get('metric', 'ssim').lower()
-    threading.Thread(target=run_batch, args=(start, size, current_app.simulator, current_app.progress, metric), daemon=True).start()
-    return '', 202
+    engine = request.args.get('engine', 'aer').lower()
+    sweep = request.args.get('sweep', 'per_shot').lower()
+    if engine not in ENGINES:
+        return f"Unknown engine: {engine}", 400
+    synthesis = request.args.get('synthesis', 'mcry').lower()
+    encoder = request.args.get('encoder', 'frqi').lower()
+    image_size = request.args.get('image_size', type=int)
+    # a fixed default seed, so analysing the same batch again is served from the cache
+    seed = request.args.get('seed', 0, type=int)
+    if sweep not in SWEEP_MODES:
+        return f"Unknown sweep mode: {sweep}", 400
+    executor = request.args.get('executor', 'thread').lower()
+    workers = request.args.get('workers', type=int)
+    if synthesis not in SYNTHESIS_MODES:
+        return f"Unknown synthesis mode: {synthesis}", 400
+    if executor not in ('thread', 'process', 'batched'):
+        return f"Unknown executor: {executor}", 400
+    if workers is not None:
+        # the scheduler bounds concurrent jobs, this bounds the processes/threads of one
+        workers = min(max(workers, 1), os.cpu_count())
+    if not (0 <= start < dataset_size() and 1 <= size <= dataset_size() - start):
+        return f"start and size must select images within 0-{dataset_size() - 1}, got start={start}, size={size}", 400
+    error = encoding_error(encoder, image_size)
+    if error:
+        return error, 400
+    try:
+        job = current_app.scheduler.submit(start=start, size=size, metric=metric, engine=engine, sweep=sweep,
+                                           synthesis=synthesis, executor=executor, workers=workers, encoder=encoder,
+                                           image_size=image_size, seed=seed)
+    except QueueFull as e:
+        return jsonify({'error': f"Too many queued jobs ({e}), try again later"}), 429, {'Retry-After': '30'}
+    return jsonify({'job': job.id}), 202
 
 @batch_bp.route('/progress')
 def get_progress():
-    return jsonify(current_app.progress)
+    job, error = _job_or_404()
+    if error:
+        return error
+    return jsonify(job.to_dict())
+
+@batch_bp.route('/progress_stream')
+def progress_stream():
+    # Server-sent events: an 'image' event per finished image (with running per-shot
+    # mean/std), a 'progress' heartbeat while waiting and a final 'end' event.
+    # Reconnecting clients resume after Last-Event-ID.
+    job, error = _job_or_404()
+    if error:
+        return error
+    try:
+        sent = max(int(request.headers.get('Last-Event-ID', -1)) + 1, 0)
+    except ValueError:
+        sent = 0
+
+    def events():
+        nonlocal sent
+        while True:
+            for event_id, event in job.wait_events(sent, timeout=15):
+                yield f"id: {event_id}\nevent: image\ndata: {json.dumps(event)}\n\n"
+                sent = event_id + 1
+            if job.finished and sent >= job.num_events:
+                yield f"event: end\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+            yield f"event: progress\ndata: {json.dumps(job.to_dict())}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@batch_bp.route('/jobs')
+def list_jobs():
+    return jsonify([job.to_dict() for job in current_app.scheduler.jobs()])
+
+@batch_bp.route('/cancel', methods=['POST'])
+def cancel():
+    job = current_app.scheduler.cancel(request.args.get('job', ''))
+    if job is None:
+        return jsonify({'error': f"Unknown job: {request.args.get('job')}"}), 404
+    return jsonify(job.to_dict())
 
 @batch_bp.route('/result')
 def result():
-    start = int(request.args.get('start', 0))
-    size = int(request.args.get('size', 20))
-    metric = request.args.get('metric', 'ssim').lower()
+    if 'job' in request.args:
+        job, error = _job_or_404()
+        if error:
+            return error
+        if job.progress['status'] != 'done':
+            return f"Job {job.id} is {job.progress['status']}.", 409 if job.finished else 503
+        start, size, metric = job.params['start'], job.params['size'], job.params['metric']
+        plot_filename, csv_link = job.result['plot'], f'/download_csv?job={job.id}'
+    else:
+        start = int(request.args.get('start', 0))
+        size = int(request.args.get('size', 20))
+        metric = request.args.get('metric', 'ssim').lower()
+        plot_filename = None
+        csv_link = f'/download_csv?start={start}&metric={metric}'
     metric_name = 'SSIM' if metric == 'ssim' else 'MAE'
-    plot_filename = f'batch_{start}_plot_{metric_name.lower()}.png'
+    plot_filename = plot_filename or f'batch_{start}_plot_{metric_name.lower()}.png'
     if not os.path.exists(plot_filename):
         return "Plot not found. Please process the batch first.", 503
     with open(plot_filename, 'rb') as f:
         plot_data = base64.b64encode(f.read()).decode('utf-8')
+    job_field = f'<input type="hidden" name="job" value="{job.id}" />' if 'job' in request.args else ''
 
     html = f'''
     <h2>Batch {start}–{start+size-1} Processed</h2>
-    <p><a href="/download_csv?start={start}&metric={metric}">Download Results CSV</a></p>
+    <p><a href="{csv_link}">Download Results CSV</a></p>
     <h3>Average {metric_name} vs Shots</h3>
     <img src="data:image/png;base64,{plot_data}" alt="{metric_name} Plot"/>
     <h3>Inspect Specific Image</h3>
     <form action="/inspect_image" method="get">
         <input type="hidden" name="start" value="{start}" />
         <input type="hidden" name="metric" value="{metric}" />
+        {job_field}
         <label for="image">Image Index in Batch:</label>
         <input type="number" name="image" min="{start}" max="{start+size-1}" required />
         <label for="shots">Shot Count:</label>
-        <input type="number" name="shots" required />
+        <input type="number" name="shots" min="1" max="{MAX_SHOTS}" required />
+        <label for="seed">Seed:</label>
+        <input type="number" name="seed" min="0" value="{DEFAULT_SEED}" />
         <button type="submit">View Details</button>
     </form>
     '''
@@ -50,6 +146,13 @@ def result():
 
 @batch_bp.route('/download_csv')
 def download_csv():
+    if 'job' in request.args:
+        job, error = _job_or_404()
+        if error:
+            return error
+        if job.result is None:
+            return "CSV not found.", 404
+        return send_file(os.path.join(os.getcwd(), job.result['csv']), as_attachment=True)
     start = request.args.get('start', '0')
     metric = request.args.get('metric', 'ssim').lower()
     metric_name = metric
@@ -3,80 +3,69 @@ import random
 import base64
 import os
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import csv
-from qiskit import transpile
-from qiskit_aer import AerSimulator
-from website.preprocess import load_and_process_image
-from website.build_circuit import build_circuit
-from website.analysis import SSIM, balanced_weighted_mae
-from website.plot import plot_metrics
+from website.preprocess import load_and_process_image, dataset_size
+from website.analysis import SSIM_batch, balanced_weighted_mae_batch
+from website.simulate import ENCODERS, SWEEP_MODES, get_simulator
+from website.build_circuit import SYNTHESIS_MODES
+from website.logic.batch_processing import decode_images, simulate_images
+from website.results import ResultWriter, RunningStats
 
 debug_bp = Blueprint('debug', __name__)
 
 @debug_bp.route('/debug_run')
 def debug_run():
+    from website.plot import plot_metrics
+
     metric = request.args.get('metric', 'ssim').lower()
     metric_name = 'SSIM' if metric == 'ssim' else 'MAE'
-    total_images = 42000  # Adjust if your dataset size is different
+    sweep = request.args.get('sweep', 'per_shot').lower()
+    synthesis = request.args.get('synthesis', 'mcry').lower()
+    encoder = request.args.get('encoder', 'frqi').lower()
+    if sweep not in SWEEP_MODES:
+        return f"Unknown sweep mode: {sweep}", 400
+    if synthesis not in SYNTHESIS_MODES:
+        return f"Unknown synthesis mode: {synthesis}", 400
+    if encoder not in ENCODERS:
+        return f"Unknown encoder: {encoder}", 400
+    total_images = dataset_size()
     random_indices = sorted(random.sample(range(total_images), 10))
     # Shots: 20, 40, ..., 200, 400, 600, ..., 3000
     shot_counts = np.concatenate([
         np.arange(20, 201, 20),
         np.arange(200, 3001, 200)
     ])
-    all_rows = [('ImageIndex', 'Shots', metric_name)]
-    avg_metric = np.zeros_like(shot_counts, dtype=float)
-    metric_matrix = np.zeros((len(shot_counts), len(random_indices)))
-    simulator = AerSimulator()
+    simulator = get_simulator()
     images, _ = load_and_process_image(0)
 
     print(f"DEBUG RUN: Using {metric_name} for 10 images.")
 
-    for img_idx, i in enumerate(random_indices):
-        try:
+    # all 10 images and every shot count go to the simulator as one job
+    originals = images[random_indices]
+    count_grid = simulate_images(originals, shot_counts, simulator, sweep=sweep, synthesis=synthesis,
+                                 encoder=encoder)
+    retrieved_grid = decode_images(count_grid, shot_counts, encoder)
+
+    if metric == 'mae':
+        metric_grid = balanced_weighted_mae_batch(originals, retrieved_grid)
+    else:
+        metric_grid = SSIM_batch(originals, retrieved_grid)
+    stats = RunningStats(len(shot_counts))
+    stats.update_batch(metric_grid)
+
+    # Save CSV (and .npy parts)
+    with ResultWriter(f'debug_results_{metric_name.lower()}', metric_name) as writer:
+        for img_idx, i in enumerate(random_indices):
             print(f"Processing image {i} ({img_idx+1}/10)...")
-            _, angles = load_and_process_image(i)
-            qc = build_circuit(angles)
-            t_qc = transpile(qc, simulator, optimization_level=0)
-            metric_sums = np.zeros_like(shot_counts, dtype=float)
             for j, shots in enumerate(shot_counts):
-                print(f"  Running with {shots} shots...")
-                result = simulator.run(t_qc, shots=shots).result()
-                counts = result.get_counts()
-                retrieved = np.zeros((64,), dtype=float)
-                for idx in range(64):
-                    key = '1' + format(idx, '06b')
-                    freq = counts.get(key, 0)
-                    retrieved[idx] = np.sqrt(freq / shots) if freq else 0.0
-                retrieved_img = (retrieved * 8.0 * 255.0).astype(int).reshape((8, 8))
-                if metric == 'mae':
-                    value = balanced_weighted_mae(images[i], retrieved_img)
-                else:
-                    value = SSIM(images[i], retrieved_img)
-                print(f"    {metric_name} for image {i}, shots {shots}: {value:.4f}")
-                all_rows.append((i, shots, value))
-                metric_sums[j] = value
-                metric_matrix[j, img_idx] = value
-            avg_metric += metric_sums
-        except Exception as e:
-            print(f"Skipping image {i} due to error: {e}")
-            continue
+                print(f"    {metric_name} for image {i}, shots {shots}: {metric_grid[img_idx, j]:.4f}")
+            writer.write_image(i, shot_counts, metric_grid[img_idx])
 
-    avg_metric = np.mean(metric_matrix, axis=1)
-    std_metric = np.std(metric_matrix, axis=1)
+    avg_metric = stats.mean
+    std_metric = stats.std()
     print("Standard deviations for each shot count:", std_metric)
 
-    # Save CSV
-    filename = f'debug_results_{metric_name.lower()}.csv'
-    with open(filename, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerows(all_rows)
-
     # Plot with error bars and trendline using shared utility
-    plot_title = 'FRQI: Shots vs Average Fidelity'
+    plot_title = f'{encoder.upper()}: Shots vs Average Fidelity'
     plot_metrics(
         shot_counts=shot_counts, 
         avg_metric=avg_metric, 
@@ -0,0 +1,54 @@
+from urllib.parse import urlencode
+from flask import Blueprint, request, make_response, abort, current_app
+from website.preprocess import dataset_size, get_image, prepare_image
+from website.png import DEFAULT_SCALE, render_png
+from website.reconstruction import MAX_SHOTS, encoding_error, reconstruct
+from website.simulate import get_simulator
+
+images_bp = Blueprint('images', __name__)
+
+RECONSTRUCTION_KINDS = ('original', 'retrieved', 'diff')
+
+def _png_response(key, data, max_age):
+    response = make_response(data)
+    response.mimetype = 'image/png'
+    response.set_etag(key)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+@images_bp.route('/img/<int:index>.png')
+def dataset_image(index):
+    if not 0 <= index < dataset_size():
+        abort(404)
+    scale = min(max(request.args.get('scale', DEFAULT_SCALE, type=int), 1), 64)
+    key, data = render_png(get_image(index), scale)
+    return _png_response(key, data, 86400)
+
+def reconstruction_url(index, shots, seed, kind, encoder='frqi', image_size=None):
+    # /img/recon URL for one image of a seeded reconstruction; the URL carries everything
+    # needed to render it again, so it does not depend on any in-process cache
+    params = {'shots': shots, 'seed': seed, 'encoder': encoder, 'kind': kind}
+    if image_size is not None:
+        params['image_size'] = image_size
+    return f'/img/recon/{index}.png?{urlencode(params)}'
+
+@images_bp.route('/img/recon/<int:index>.png')
+def reconstruction_image(index):
+    # original, retrieved or difference image of reconstruct(); seeded, so always the same
+    shots = request.args.get('shots', type=int)
+    seed = request.args.get('seed', type=int)
+    kind = request.args.get('kind', 'retrieved')
+    encoder = request.args.get('encoder', 'frqi').lower()
+    image_size = request.args.get('image_size', type=int)
+    if (not 0 <= index < dataset_size() or shots is None or not 1 <= shots <= MAX_SHOTS or seed is None
+            or kind not in RECONSTRUCTION_KINDS or encoding_error(encoder, image_size)):
+        abort(404)
+    if kind == 'original':
+        image = prepare_image(get_image(index), image_size)
+    else:
+        result_cache = getattr(current_app, 'result_cache', None)
+        image = reconstruct(index, shots, get_simulator(), seed, 'all', result_cache, encoder=encoder,
+                            image_size=image_size)[kind]
+    key, data = render_png(image)
+    return _png_response(key, data, 86400)
@@ -21,13 +21,42 @@ def index():
             <option value="mae">MAE</option>
             <option value="quantum_state">Quantum Fidelity</option>
         </select>
+        <label for="engine">Engine:</label>
+        <select id="engine" name="engine">
+            <option value="aer">Aer (circuit simulation)</option>
+            <option value="analytic">Analytic (ideal state)</option>
+        </select>
+        <label for="sweep">Shot Sweep:</label>
+        <select id="sweep" name="sweep">
+            <option value="per_shot">One simulation per shot count</option>
+            <option value="distribution">Simulate once, sample every shot count</option>
+            <option value="nested">Nested: one shot stream, prefixes per shot count</option>
+        </select>
+        <label for="synthesis">Circuit:</label>
+        <select id="synthesis" name="synthesis">
+            <option value="mcry">Multi-controlled RY</option>
+            <option value="ucr">Uniformly controlled RY (Gray code)</option>
+        </select>
+        <label for="encoder">Encoding:</label>
+        <select id="encoder" name="encoder">
+            <option value="frqi">FRQI</option>
+            <option value="neqr">NEQR</option>
+        </select>
+        <label for="image_size">Image Size:</label>
+        <select id="image_size" name="image_size">
+            <option value="">Dataset (8x8)</option>
+            <option value="16">16x16 (FRQI)</option>
+            <option value="32">32x32 (FRQI)</option>
+        </select>
+        <label for="seed">Seed:</label>
+        <input type="number" id="seed" name="seed" value="0" min="0">
         <input type="submit" value="Start Processing">
     </form>
-    <button onclick="window.location.href='/debug_run?metric=' + document.getElementById('metric').value">Debug: Run 10 Random Images</button>
+    <button onclick="window.location.href='/debug_run?metric=' + document.getElementById('metric').value + '&sweep=' + document.getElementById('sweep').value + '&synthesis=' + document.getElementById('synthesis').value + '&encoder=' + document.getElementById('encoder').value">Debug: Run 10 Random Images</button>
     <div id="progress"></div>
     <script>
     const form = document.getElementById('batchForm');
-    form.onsubmit = e => {
+    form.onsubmit = async e => {
         e.preventDefault();
         document.getElementById('batchSlider').disabled = true;
         document.querySelector('input[type="submit"]').disabled = true;
@@ -35,7 +64,21 @@ def index():
         const start_index = batch_number * 20;
         document.getElementById('start_index').value = start_index;
         const metric = document.getElementById('metric').value;
-        fetch(`/start_batch?start=${start_index}&size=20&metric=${metric}`);
+        const engine = document.getElementById('engine').value;
+        const sweep = document.getElementById('sweep').value;
+        const synthesis = document.getElementById('synthesis').value;
+        const encoder = document.getElementById('encoder').value;
+        const imageSize = document.getElementById('image_size').value;
+        const seed = document.getElementById('seed').value || 0;
+        const started = await fetch(`/start_batch?start=${start_index}&size=20&metric=${metric}&engine=${engine}&sweep=${sweep}&synthesis=${synthesis}&encoder=${encoder}&seed=${seed}` + (imageSize ? `&image_size=${imageSize}` : ''));
+        const startData = await started.json();
+        if (!started.ok) {
+            document.getElementById('progress').innerText = startData.error;
+            document.getElementById('batchSlider').disabled = false;
+            document.querySelector('input[type="submit"]').disabled = false;
+            return;
+        }
+        const job = startData.job;
 
         const bar = document.createElement('progress');
         bar.max = 20;
@@ -44,32 +87,78 @@ def index():
         const timer = document.createElement('p');
         timer.id = 'timer';
         timer.innerText = 'Elapsed Time: 0.0s';
+        const chart = document.createElement('canvas');
+        chart.width = 640;
+        chart.height = 320;
         document.getElementById('progress').innerHTML = '<p id="progressText"></p>';
         document.getElementById('progress').appendChild(bar);
         document.getElementById('progress').appendChild(timer);
+        const cancelButton = document.createElement('button');
+        cancelButton.innerText = 'Cancel';
+        cancelButton.onclick = () => fetch(`/cancel?job=${job}`, {method: 'POST'});
+        document.getElementById('progress').appendChild(cancelButton);
+        document.getElementById('progress').appendChild(chart);
 
+        let startTime = Date.now();
         let timeTicker = setInterval(() => {
             const elapsed = (Date.now() - startTime) / 1000;
             timer.innerText = `Elapsed Time: ${elapsed.toFixed(1)}s`;
         }, 500);
 
-        let startTime = Date.now();
-        let interval = setInterval(async () => {
-            const res = await fetch('/progress');
-            const data = await res.json();
+        // running mean ± std per shot count, redrawn as each image finishes
+        const drawChart = data => {
+            const ctx = chart.getContext('2d');
+            const pad = 40, w = chart.width - 2 * pad, h = chart.height - 2 * pad;
+            const maxShots = Math.max(...data.shots);
+            const x = s => pad + w * s / maxShots;
+            const y = v => pad + h * (1 - Math.min(Math.max(v, 0), 1.05) / 1.05);
+            ctx.clearRect(0, 0, chart.width, chart.height);
+            ctx.strokeStyle = '#999';
+            ctx.strokeRect(pad, pad, w, h);
+            ctx.fillStyle = '#000';
+            ctx.fillText(`${metric} after ${data.images} images`, pad, pad - 10);
+            ctx.fillText('0', pad - 15, y(0));
+            ctx.fillText('1', pad - 15, y(1));
+            ctx.fillText(`${maxShots} shots`, pad + w - 50, pad + h + 20);
+            ctx.strokeStyle = '#1f77b4';
+            data.shots.forEach((s, k) => {
+                ctx.beginPath();
+                ctx.moveTo(x(s), y(data.mean[k] - data.std[k]));
+                ctx.lineTo(x(s), y(data.mean[k] + data.std[k]));
+                ctx.stroke();
+                ctx.beginPath();
+                ctx.arc(x(s), y(data.mean[k]), 3, 0, 2 * Math.PI);
+                ctx.fill();
+            });
+        };
+
+        const source = new EventSource(`/progress_stream?job=${job}`);
+        const showProgress = e => {
+            const data = JSON.parse(e.data);
             bar.value = data.done;
+            if (data.status === 'queued') {
+                document.getElementById('progressText').innerText = `Job ${job} is waiting for a free worker...`;
+                startTime = Date.now();
+                return;
+            }
             const elapsed = (Date.now() - startTime) / 1000;
             const rate = data.done / elapsed;
             const remaining = rate > 0 ? (data.total - data.done) / rate : 0;
             document.getElementById('progressText').innerText =
                 `Processed ${data.done} of ${data.total} images...\nEstimated time remaining: ${remaining.toFixed(1)}s`;
-
-            if (data.done >= data.total) {
-                clearInterval(interval);
-                clearInterval(timeTicker);
-                window.location.href = `/result?start=${start_index}&size=20&metric=${metric}`;
+        };
+        source.addEventListener('progress', showProgress);
+        source.addEventListener('image', e => drawChart(JSON.parse(e.data)));
+        source.addEventListener('end', e => {
+            source.close();
+            clearInterval(timeTicker);
+            const data = JSON.parse(e.data);
+            if (data.status === 'done') {
+                window.location.href = `/result?job=${job}`;
+            } else {
+                document.getElementById('progressText').innerText = `Job ${job} ${data.status}.`;
             }
-        }, 1000);
+        });
     };
     </script>
     '''
\ No newline at end of file
@@ -1,24 +1,81 @@
-from qiskit import transpile
-from qiskit_aer import AerSimulator
+import threading
 import numpy as np
+from .analytic import sample_counts
+from .decode import counts_to_array, decode_counts
+from .build_circuit import parameter_binds
 
-simulator = AerSimulator()
-
-def simulate_and_decode(qc, num_shots=1000):
-    t_qc = transpile(qc, simulator)
-    result = simulator.run(t_qc, shots=num_shots).result()
-    counts = result.get_counts()
-    simplified_counts = {key.split()[0]: value for key, value in counts.items()}
-    retrieve_image = np.array([])
-    for i in range(64):
-        s = format(i, '06b')
-        new_s = '1' + s
-        try:
-            value = np.sqrt(simplified_counts[new_s] / num_shots)
-        except KeyError:
-            value = 0.0
-        retrieve_image = np.append(retrieve_image, value)
-    retrieve_image *= 8.0 * 255.0
-    retrieve_image = retrieve_image.astype('int')
-    retrieve_image = retrieve_image.reshape((8, 8))
-    return retrieve_image, simplified_counts
\ No newline at end of file
+_simulator = None
+_simulator_lock = threading.Lock()
+
+ENGINES = ('aer', 'analytic')
+ENCODERS = ('frqi', 'neqr')
+SWEEP_MODES = ('per_shot', 'distribution', 'nested')
+
+def get_simulator():
+    # Shared AerSimulator, created (and qiskit_aer imported) on first use
+    global _simulator
+    with _simulator_lock:
+        if _simulator is None:
+            from qiskit_aer import AerSimulator
+            _simulator = AerSimulator()
+        return _simulator
+
+def outcome_probabilities(t_qc, simulator=None):
+    # Exact outcome distribution (2 * pixels outcomes, Aer bit order) from a single Aer run,
+    # so a whole shot grid can be sampled without re-simulating the circuit
+    simulator = simulator or get_simulator()
+    qc = t_qc.remove_final_measurements(inplace=False)
+    qc.save_probabilities()
+    result = simulator.run(qc, shots=1).result()
+    probs = np.clip(np.asarray(result.data()['probabilities'], dtype=float), 0.0, None)
+    return probs / probs.sum()
+
+def outcome_stream(t_qc, shots, simulator=None, seed=None):
+    # Per-shot outcome integers in measurement order, for nested shot sweeps
+    simulator = simulator or get_simulator()
+    result = simulator.run(t_qc, shots=shots, memory=True, seed_simulator=seed).result()
+    return np.array([int(m.replace(' ', ''), 2) for m in result.get_memory()], dtype=np.int64)
+
+def batched_outcome_streams(template, angles_batch, shots, simulator=None, seed=None):
+    # One Aer job for a whole batch of images bound into the template: (images, shots)
+    # outcome integers. Aer runs the bindings as parallel experiments.
+    simulator = simulator or get_simulator()
+    t_qc = template[0]
+    result = simulator.run([t_qc], parameter_binds=parameter_binds(template, angles_batch), shots=shots,
+                           memory=True, seed_simulator=seed, max_parallel_experiments=0).result()
+    return np.array([[int(m, 16) for m in result.data(k)['memory']] for k in range(len(angles_batch))],
+                    dtype=np.int64)
+
+def batched_probabilities(template, angles_batch, simulator=None):
+    # Exact outcome distributions (images, 2 * pixels) for a batch of images in one Aer job
+    simulator = simulator or get_simulator()
+    t_qc, theta, synthesis = template
+    qc = t_qc.remove_final_measurements(inplace=False)
+    qc.save_probabilities()
+    result = simulator.run([qc], parameter_binds=parameter_binds((qc, theta, synthesis), angles_batch), shots=1,
+                           max_parallel_experiments=0).result()
+    probs = np.array([result.data(k)['probabilities'] for k in range(len(angles_batch))], dtype=float)
+    probs = np.clip(probs, 0.0, None)
+    return probs / probs.sum(axis=1, keepdims=True)
+
+def simulate_and_decode(qc, num_shots=1000, engine='aer', angles=None, seed=None):
+    if engine == 'aer':
+        from qiskit import transpile
+
+        simulator = get_simulator()
+        t_qc = transpile(qc, simulator)
+        result = simulator.run(t_qc, shots=num_shots, seed_simulator=seed).result()
+        counts = result.get_counts()
+        simplified_counts = {key.split()[0]: value for key, value in counts.items()}
+    elif engine == 'analytic':
+        # the analytic engine samples the ideal state straight from the angles, qc is unused
+        if angles is None:
+            raise ValueError("The analytic engine needs the image angles")
+        outcome_counts = sample_counts(angles, num_shots, rng=seed)
+        width = (len(outcome_counts) - 1).bit_length()
+        simplified_counts = {format(o, f'0{width}b'): int(c) for o, c in enumerate(outcome_counts) if c}
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+    num_outcomes = 2 * len(angles) if angles is not None else 2 ** qc.num_qubits
+    retrieve_image = decode_counts(counts_to_array(simplified_counts, num_outcomes), num_shots)
+    return retrieve_image, simplified_counts
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from website.build_circuit import SYNTHESIS_MODES
+from website.logic.batch_processing import _process_image_in_worker, get_process_pool, image_seed, process_image
+from website.preprocess import dataset_size, get_image, load_dataset, prepare_image
+from website.results import ResultWriter, RunningStats, write_summary
+from website.simulate import ENCODERS, ENGINES, SWEEP_MODES, get_simulator
+
+# Usage: python -m website.sweep --out sweeps/full [--shard 0/4] [--start 0] [--end 42000]
+#                                [--shots 100:2100:100] [--metric ssim] [--encoder neqr] [--workers 8]
+#                                [--image-size 32]
+#        python -m website.sweep --out sweeps/merged --merge sweeps/shard0 sweeps/shard1 ...
+# Headless metric sweep over any image range. The range is split into N contiguous shards
+# (one per machine); each shard checkpoints after every chunk of images and resumes from
+# the checkpoint when restarted with the same arguments. Every image gets its own seed
+# derived from (--seed, image index), so results do not depend on sharding or chunking.
+# Rows are streamed to results.csv and results_partNNNNN.npy; per-shot statistics are
+# mergeable, so --merge combines finished (or partial) shards exactly.
+
+METRICS = ('balanced_mae', 'mae', 'ssim', 'quantum_state')
+CHECKPOINT_NAME = 'checkpoint.json'
+RESULTS_PREFIX = 'results'
+SUMMARY_NAME = 'summary.csv'
+
+def parse_shots(text):
+    # '100:2100:100' (range, end exclusive) or '100,500,1000'
+    if ':' in text:
+        start, stop, step = (int(x) for x in text.split(':'))
+        shots = np.arange(start, stop, step)
+    else:
+        shots = np.array([int(x) for x in text.split(',')])
+    if shots.size == 0 or np.any(shots <= 0):
+        raise argparse.ArgumentTypeError(f"invalid shot grid: {text}")
+    return shots
+
+def parse_shard(text):
+    try:
+        shard, num_shards = (int(x) for x in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/N: {text}")
+    if not 0 <= shard < num_shards:
+        raise argparse.ArgumentTypeError(f"shard index out of range: {text}")
+    return shard, num_shards
+
+def shard_indices(start, end, shard, num_shards):
+    return np.array_split(np.arange(start, end), num_shards)[shard]
+
+def _atomic_write_json(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_checkpoint(out_dir, config):
+    path = os.path.join(out_dir, CHECKPOINT_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['config'] != config:
+        raise SystemExit(f"{path} was written with different arguments; use another --out directory")
+    return checkpoint
+
+def run_chunk(indices, shot_counts, metric, engine, sweep, synthesis, base_seed, workers, cache, encoder='frqi',
+              image_size=None):
+    # -> list of (index, metric values or None for a skipped image)
+    seeds = [image_seed(base_seed, i) for i in indices]
+    if workers == 1:
+        images, _ = load_dataset()
+        simulator = get_simulator() if engine == 'aer' else None
+        results = []
+        for i, seed in zip(indices, seeds):
+            rows, values = process_image(i, images, shot_counts, simulator, metric, engine, seed, sweep,
+                                         synthesis, cache, encoder, image_size)
+            results.append((i, values if rows else None))
+        return results
+    pool = get_process_pool(workers)
+    futures = [pool.submit(_process_image_in_worker, i, shot_counts, metric, engine, seed, sweep, synthesis, cache,
+                           encoder, image_size)
+               for i, seed in zip(indices, seeds)]
+    return [(i, future.result()) for i, future in zip(indices, futures)]
+
+def merge_shards(shard_dirs, out_dir):
+    # combined per-shot statistics of several shard directories -> out_dir/summary.csv
+    stats, shots = None, None
+    for shard_dir in shard_dirs:
+        with open(os.path.join(shard_dir, CHECKPOINT_NAME)) as f:
+            checkpoint = json.load(f)
+        if shots is not None and checkpoint['config']['shots'] != shots:
+            raise SystemExit(f"{shard_dir} used a different shot grid")
+        shots = checkpoint['config']['shots']
+        shard_stats = RunningStats.from_dict(checkpoint['stats'])
+        stats = shard_stats if stats is None else stats.merge(shard_stats)
+    os.makedirs(out_dir, exist_ok=True)
+    write_summary(os.path.join(out_dir, SUMMARY_NAME), shots, stats)
+    print(f"Merged {len(shard_dirs)} shards: {stats.count} images")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sharded, resumable FRQI/NEQR metric sweep')
+    parser.add_argument('--out', required=True, help='output directory for this shard')
+    parser.add_argument('--merge', nargs='+', metavar='SHARD_DIR', help='only merge these shard outputs into --out')
+    parser.add_argument('--start', type=int, default=0)
+    parser.add_argument('--end', type=int, default=None, help='end index (exclusive), default: whole dataset')
+    parser.add_argument('--shots', type=parse_shots, default=parse_shots('100:2100:100'))
+    parser.add_argument('--shard', type=parse_shard, default=(0, 1), help='i/N: run the i-th of N shards')
+    parser.add_argument('--metric', choices=METRICS, default='ssim')
+    parser.add_argument('--engine', choices=ENGINES, default='aer')
+    parser.add_argument('--sweep', choices=SWEEP_MODES, default='per_shot')
+    parser.add_argument('--synthesis', choices=SYNTHESIS_MODES, default='mcry', help='FRQI circuit construction')
+    parser.add_argument('--encoder', choices=ENCODERS, default='frqi')
+    parser.add_argument('--image-size', type=int, default=None,
+                        help='FRQI register side (power of two); smaller images are upsampled or padded')
+    parser.add_argument('--seed', type=int, default=0, help='base seed for the per-image seeds')
+    parser.add_argument('--chunk-size', type=int, default=200, help='images per checkpoint')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes (1 runs in-process)')
+    parser.add_argument('--cache', default=None, help='SQLite result cache path (off by default)')
+    args = parser.parse_args(argv)
+    if args.merge:
+        return merge_shards(args.merge, args.out)
+    if args.encoder == 'neqr' and args.image_size not in (None, 8):
+        parser.error("NEQR encodes 8x8 images only")
+    try:
+        prepare_image(get_image(0), args.image_size)
+    except ValueError as e:
+        parser.error(str(e))
+
+    end = dataset_size() if args.end is None else min(args.end, dataset_size())
+    shard, num_shards = args.shard
+    indices = shard_indices(args.start, end, shard, num_shards)
+    shot_counts = args.shots
+    config = {'start': args.start, 'end': end, 'shots': shot_counts.tolist(), 'shard': [shard, num_shards],
+              'metric': args.metric, 'engine': args.engine, 'sweep': args.sweep, 'synthesis': args.synthesis,
+              'seed': args.seed, 'encoder': args.encoder, 'image_size': args.image_size}
+    cache = None
+    if args.cache:
+        from website.result_cache import ResultCache
+        cache = ResultCache(args.cache)
+
+    os.makedirs(args.out, exist_ok=True)
+    checkpoint_path = os.path.join(args.out, CHECKPOINT_NAME)
+    checkpoint = load_checkpoint(args.out, config)
+    results_prefix = os.path.join(args.out, RESULTS_PREFIX)
+    if checkpoint is None:
+        writer = ResultWriter(results_prefix, args.metric)
+        checkpoint = {'config': config, 'next': 0, 'skipped': [], 'writer': writer.state(),
+                      'stats': RunningStats(len(shot_counts)).to_dict()}
+        _atomic_write_json(checkpoint_path, checkpoint)
+    else:
+        # rows written after the last checkpoint belong to a chunk that will be redone
+        print(f"Resuming shard {shard}/{num_shards} at image {checkpoint['next']} of {len(indices)}")
+        writer = ResultWriter(results_prefix, args.metric, resume=checkpoint['writer'])
+
+    stats = RunningStats.from_dict(checkpoint['stats'])
+    began, done_at_start = time.time(), checkpoint['next']
+    with writer:
+        for pos in range(checkpoint['next'], len(indices), args.chunk_size):
+            chunk = indices[pos:pos + args.chunk_size].tolist()
+            results = run_chunk(chunk, shot_counts, args.metric, args.engine, args.sweep, args.synthesis,
+                                args.seed, args.workers, cache, args.encoder, args.image_size)
+            for i, values in results:
+                if values is None:
+                    checkpoint['skipped'].append(i)
+                    continue
+                writer.write_image(i, shot_counts, values)
+                stats.update(values)
+            checkpoint.update(next=pos + len(chunk), writer=writer.state(), stats=stats.to_dict())
+            _atomic_write_json(checkpoint_path, checkpoint)
+
+            done = checkpoint['next']
+            rate = (done - done_at_start) / max(time.time() - began, 1e-9)
+            remaining = (len(indices) - done) / rate if rate > 0 else 0
+            print(f"{done}/{len(indices)} images, {rate:.1f} images/s, ~{remaining:.0f}s remaining", flush=True)
+
+    write_summary(os.path.join(args.out, SUMMARY_NAME), shot_counts, stats)
+    print(f"Shard {shard}/{num_shards} complete: {stats.count} images, {len(checkpoint['skipped'])} skipped")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
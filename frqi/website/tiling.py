@@ -0,0 +1,179 @@
+import argparse
+import sys
+import time
+import numpy as np
+from website.decode import decode_counts
+from website.logic.batch_processing import (_get_worker_simulator, get_process_pool, metric_values,
+                                            simulate_counts_batch)
+from website.preprocess import get_image, image_to_angles, prepare_image
+from website.simulate import ENGINES, SWEEP_MODES, get_simulator
+from website.build_circuit import SYNTHESIS_MODES
+
+# Usage: python -m website.tiling --index 7 --size 256 [--shots 1000] [--budget image]
+#                                 [--engine aer] [--workers 8] [--compare] [--out recon.png]
+#        python -m website.tiling --npy photo.npy ...
+# Tiled FRQI for images of any size: the image is cut into 8x8 tiles (zero-padded at the
+# bottom/right edge), every tile goes through the regular 8x8 FRQI path, chunks of tiles
+# run as batched jobs across the worker pool, and the decoded tiles are stitched back.
+# Time and memory grow linearly with the number of tiles. --compare also runs the whole
+# image as one large FRQI register as a throughput baseline.
+
+TILE = 8
+BUDGETS = ('tile', 'image')
+METRICS = ('balanced_mae', 'mae', 'ssim', 'quantum_state')
+
+def split_tiles(image, tile=TILE):
+    # (H, W) -> ((tiles, tile, tile) in row-major tile order, (tile rows, tile cols))
+    image = np.asarray(image)
+    height, width = image.shape
+    rows, cols = -(-height // tile), -(-width // tile)
+    padded = np.zeros((rows * tile, cols * tile), dtype=image.dtype)
+    padded[:height, :width] = image
+    tiles = padded.reshape(rows, tile, cols, tile).swapaxes(1, 2).reshape(-1, tile, tile)
+    return tiles, (rows, cols)
+
+def stitch_tiles(tiles, grid, shape):
+    # (..., tiles, tile, tile) -> (..., H, W), the inverse of split_tiles
+    tiles = np.asarray(tiles)
+    rows, cols = grid
+    tile = tiles.shape[-1]
+    lead = tiles.shape[:-3]
+    image = tiles.reshape(lead + (rows, cols, tile, tile)).swapaxes(-3, -2)
+    image = image.reshape(lead + (rows * tile, cols * tile))
+    return image[..., :shape[0], :shape[1]]
+
+def tile_shots(shot_counts, num_tiles, budget='tile'):
+    # shots each tile gets: shot_counts as given ('tile'), or an image-wide budget split
+    # evenly over the tiles ('image', remainders are dropped)
+    shot_counts = np.atleast_1d(np.asarray(shot_counts, dtype=np.int64))
+    if budget == 'tile':
+        return shot_counts
+    elif budget == 'image':
+        per_tile = shot_counts // num_tiles
+        if np.any(per_tile < 1):
+            raise ValueError(f"An image budget of {shot_counts.min()} shots is less than one per tile "
+                             f"({num_tiles} tiles)")
+        return per_tile
+    else:
+        raise ValueError(f"Unknown shot budget: {budget}")
+
+def _reconstruct_tiles(tiles, shot_counts, simulator, engine, seed, sweep, synthesis):
+    # (n, 8, 8) tiles -> decoded (n, S, 8, 8) as one batched job
+    angles_batch = image_to_angles(tiles).reshape(len(tiles), -1)
+    count_grid = simulate_counts_batch(angles_batch, shot_counts, simulator, engine, seed, sweep, synthesis)
+    return decode_counts(count_grid, shot_counts).astype(np.int32)
+
+def _reconstruct_tiles_in_worker(tiles, shot_counts, engine, seed, sweep, synthesis):
+    simulator = _get_worker_simulator() if engine == 'aer' else None
+    return _reconstruct_tiles(tiles, shot_counts, simulator, engine, seed, sweep, synthesis)
+
+def _chunk_seed(seed, chunk):
+    # chunks get independent streams, so results do not depend on the worker count
+    if seed is None:
+        return None
+    return int(np.random.SeedSequence([seed, chunk]).generate_state(1)[0] % (2 ** 30))
+
+def reconstruct_tiled(image, shot_counts, simulator=None, engine='aer', budget='tile', seed=None,
+                      sweep='per_shot', synthesis='mcry', workers=1, tiles_per_job=64):
+    # -> (reconstructions (S, H, W) for the S shot counts, shots per tile (S,)).
+    # workers=1 runs in-process, otherwise chunks of tiles_per_job tiles go to the
+    # process pool with at most 2 * workers chunks in flight.
+    image = np.asarray(image)
+    tiles, grid = split_tiles(image)
+    per_tile = tile_shots(shot_counts, len(tiles), budget)
+    starts = range(0, len(tiles), tiles_per_job)
+    retrieved = np.empty((len(tiles), len(per_tile), TILE, TILE), dtype=np.int32)
+    if workers == 1:
+        simulator = simulator or (get_simulator() if engine == 'aer' else None)
+        for c, start in enumerate(starts):
+            retrieved[start:start + tiles_per_job] = _reconstruct_tiles(
+                tiles[start:start + tiles_per_job], per_tile, simulator, engine, _chunk_seed(seed, c), sweep,
+                synthesis)
+    else:
+        pool = get_process_pool(workers)
+        pending = {}
+        for c, start in enumerate(starts):
+            if len(pending) >= 2 * workers:
+                done = next(iter(pending))
+                retrieved[done:done + tiles_per_job] = pending.pop(done).result()
+            pending[start] = pool.submit(_reconstruct_tiles_in_worker, tiles[start:start + tiles_per_job],
+                                         per_tile, engine, _chunk_seed(seed, c), sweep, synthesis)
+        for start, future in pending.items():
+            retrieved[start:start + tiles_per_job] = future.result()
+    return stitch_tiles(retrieved.swapaxes(0, 1), grid, image.shape), per_tile
+
+def reconstruct_full(image, shot_counts, simulator=None, engine='aer', seed=None, sweep='per_shot',
+                     synthesis='ucr'):
+    # Baseline: the whole image (zero-padded to a power-of-two square) as one FRQI register
+    image = np.asarray(image)
+    side = 1 << (max(image.shape) - 1).bit_length()
+    padded = np.zeros((side, side), dtype=image.dtype)
+    padded[:image.shape[0], :image.shape[1]] = image
+    simulator = simulator or (get_simulator() if engine == 'aer' else None)
+    shot_counts = np.atleast_1d(np.asarray(shot_counts, dtype=np.int64))
+    count_grid = simulate_counts_batch(image_to_angles(padded)[None], shot_counts, simulator, engine, seed, sweep,
+                                       synthesis)
+    retrieved = decode_counts(count_grid[0], shot_counts)
+    return retrieved[..., :image.shape[0], :image.shape[1]]
+
+def load_source(args):
+    if args.npy:
+        image = np.load(args.npy)
+        if image.ndim != 2:
+            raise SystemExit(f"{args.npy}: expected a 2-D greyscale array, got shape {image.shape}")
+        return np.clip(image, 0, 255).astype(np.uint8)
+    return prepare_image(get_image(args.index), args.size)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tiled FRQI reconstruction of large images')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--npy', help='2-D uint8 greyscale image saved with np.save')
+    source.add_argument('--index', type=int, default=0, help='dataset image, upsampled to --size')
+    parser.add_argument('--size', type=int, default=256, help='power-of-two side for a dataset image')
+    parser.add_argument('--shots', type=lambda text: [int(x) for x in text.split(',')], default=[1000],
+                        help='comma-separated shot counts')
+    parser.add_argument('--budget', choices=BUDGETS, default='tile',
+                        help="'tile': every tile gets --shots, 'image': --shots is split over the tiles")
+    parser.add_argument('--metric', choices=METRICS, default='ssim')
+    parser.add_argument('--engine', choices=ENGINES, default='aer')
+    parser.add_argument('--sweep', choices=SWEEP_MODES, default='per_shot')
+    parser.add_argument('--synthesis', choices=SYNTHESIS_MODES, default='ucr')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=1, help='worker processes (1 runs in-process)')
+    parser.add_argument('--tiles-per-job', type=int, default=64)
+    parser.add_argument('--compare', action='store_true', help='also time a single large-register encoding')
+    parser.add_argument('--out', help='write the reconstruction (first shot count) as a PNG')
+    args = parser.parse_args(argv)
+
+    image = load_source(args)
+    num_tiles = len(split_tiles(image)[0])
+    began = time.perf_counter()
+    retrieved, per_tile = reconstruct_tiled(image, args.shots, engine=args.engine, budget=args.budget,
+                                            seed=args.seed, sweep=args.sweep, synthesis=args.synthesis,
+                                            workers=args.workers, tiles_per_job=args.tiles_per_job)
+    elapsed = time.perf_counter() - began
+    values = metric_values(args.metric, image, retrieved)
+    print(f"Image {image.shape[0]}x{image.shape[1]}: {num_tiles} tiles in {elapsed:.2f}s "
+          f"({num_tiles / elapsed:.1f} tiles/s, {args.workers} workers)")
+    for shots, tile_shot, value in zip(args.shots, per_tile, values):
+        print(f"  {shots} shots ({tile_shot} per tile, {tile_shot * num_tiles} total): {args.metric} {value:.4f}")
+
+    if args.compare:
+        began = time.perf_counter()
+        full = reconstruct_full(image, per_tile * num_tiles, engine=args.engine, seed=args.seed, sweep=args.sweep,
+                                synthesis=args.synthesis)
+        elapsed = time.perf_counter() - began
+        print(f"Single register: {elapsed:.2f}s")
+        for shots, value in zip(per_tile * num_tiles, metric_values(args.metric, image, full)):
+            print(f"  {shots} shots: {args.metric} {value:.4f}")
+
+    if args.out:
+        from website.png import encode_png
+
+        with open(args.out, 'wb') as f:
+            f.write(encode_png(retrieved[0], scale=1))
+        print(f"Wrote {args.out}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())